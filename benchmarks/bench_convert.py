@@ -0,0 +1,138 @@
+"""Tensor <-> PIL conversion benchmark: imagegen's in-place/zero-copy paths vs the old numpy ones.
+
+Times decoded-batch -> PIL images and PIL images -> pixel batch at --batch x WIDTHxHEIGHT,
+checks both paths give identical pixels, and measures peak extra memory of one
+conversion in a fresh interpreter (Linux VmHWM, reset after the inputs are built, above
+the RSS at that point). Allocations that fit in memory the process already holds after
+a first warm-up call show up as 0.
+With CUDA available the decoded batch starts on the GPU, as with --gpu-only ComfyUI.
+
+    python benchmarks/bench_convert.py --batch 4 --size 1120x1440 --repeat 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np  # noqa: E402
+import torch  # noqa: E402
+from PIL import Image  # noqa: E402
+
+import imagegen  # noqa: E402
+
+
+def legacy_to_pil(decoded_batch):
+    batch_np = decoded_batch.detach().cpu().numpy()
+    batch_np = np.clip(batch_np, 0.0, 1.0)
+    batch_np = (batch_np * 255).astype(np.uint8)
+    return [Image.fromarray(sample) for sample in batch_np]
+
+
+def legacy_to_tensor(images):
+    tensors = []
+    for image in images:
+        np_image = np.array(image.convert("RGB"), dtype=np.float32) / 255.0
+        tensors.append(torch.from_numpy(np.expand_dims(np_image, axis=0)))
+    return torch.cat(tensors)
+
+
+VARIANTS = {
+    "to_pil legacy": lambda decoded, images: legacy_to_pil(decoded),
+    "to_pil new": lambda decoded, images: imagegen._decoded_batch_to_pil(decoded),
+    "to_tensor legacy": lambda decoded, images: legacy_to_tensor(images),
+    "to_tensor new": lambda decoded, images: imagegen._pil_batch_to_tensor(images),
+}
+
+
+def make_inputs(batch, width, height, device):
+    generator = torch.Generator().manual_seed(0)
+    # Slightly out of range, like real VAE output, so clamping matters.
+    decoded = torch.rand((batch, height, width, 3), generator=generator) * 1.1 - 0.05
+    images = legacy_to_pil(decoded)
+    return decoded.to(device), images
+
+
+def memory_status(field):
+    with open("/proc/self/status") as handle:
+        for line in handle:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) * 1024
+    raise KeyError(field)
+
+
+def reset_peak():
+    # "5" resets the peak resident set size (VmHWM) to the current RSS.
+    with open("/proc/self/clear_refs", "w") as handle:
+        handle.write("5")
+
+
+def measure_peak(variant, batch, width, height, device):
+    """Run one conversion in a fresh interpreter; peak RSS growth in bytes."""
+    code = (
+        f"import sys; sys.argv = ['bench_convert.py', '--child', {variant!r}, '--batch', '{batch}', "
+        f"'--size', '{width}x{height}', '--device', {device!r}]; "
+        f"sys.path.insert(0, {os.path.dirname(os.path.abspath(__file__))!r}); "
+        f"import bench_convert; bench_convert.main()"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])["peak"]
+
+
+def child(variant, batch, width, height, device):
+    decoded, images = make_inputs(batch, width, height, device)
+    VARIANTS[variant](decoded.clone(), images)  # first-call allocations (pinned pool, thread pools)
+    decoded = decoded.clone()
+    reset_peak()
+    before = memory_status("VmRSS")
+    result = VARIANTS[variant](decoded, images)
+    peak = memory_status("VmHWM") - before
+    print(json.dumps({"peak": max(peak, 0), "outputs": len(result)}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch", type=int, default=4)
+    parser.add_argument("--size", default="1120x1440", help="WIDTHxHEIGHT")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    width, height = map(int, args.size.lower().split("x"))
+    if args.child:
+        child(args.child, args.batch, width, height, args.device)
+        return
+
+    decoded, images = make_inputs(args.batch, width, height, args.device)
+    new_images = imagegen._decoded_batch_to_pil(decoded.clone())
+    same_pil = all(a.tobytes() == b.tobytes() for a, b in zip(legacy_to_pil(decoded), new_images))
+    same_tensor = torch.equal(legacy_to_tensor(images), imagegen._pil_batch_to_tensor(images))
+
+    timings = {}
+    for name, convert in VARIANTS.items():
+        samples = []
+        for _ in range(args.repeat):
+            source = decoded.clone()  # the new path consumes its input
+            if args.device == "cuda":
+                torch.cuda.synchronize()
+            started = time.perf_counter()
+            convert(source, images)
+            samples.append(time.perf_counter() - started)
+        timings[name] = statistics.median(samples)
+
+    float_bytes = decoded.numel() * 4
+    print(f"batch {args.batch} x {width}x{height} on {args.device}; one float batch = {float_bytes / 2**20:.0f} MiB")
+    print(f"identical pixels: to_pil {same_pil}, to_tensor {same_tensor}")
+    print(f"{'variant':<17} {'median':>9} {'peak extra':>11}")
+    for name, seconds in timings.items():
+        peak = measure_peak(name, args.batch, width, height, args.device)
+        print(f"{name:<17} {seconds * 1000:>7.1f}ms {peak / 2**20:>8.0f} MiB")
+
+
+if __name__ == "__main__":
+    main()
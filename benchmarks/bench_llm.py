@@ -0,0 +1,91 @@
+"""Prompt-enhancement client benchmark against the local stub endpoint.
+
+Compares a fresh httpx.AsyncClient per call (the old behaviour) with the shared
+LLMClient on the same workload: concurrent requests where a share of prompts repeat,
+with injected 429s. Reports wall time, requests reaching the server, TCP connections
+opened and retries.
+
+    python benchmarks/bench_llm.py --calls 40 --repeat 0.3 --fail-every 7
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx  # noqa: E402
+
+from llm_client import LLMClient  # noqa: E402
+from stub_llm import StubLLMServer  # noqa: E402
+
+TEMPLATE = "Rewrite as a detailed image prompt: {prompt}"
+
+
+def workload(calls: int, repeat: float, seed: int):
+    rng = random.Random(seed)
+    prompts = []
+    for index in range(calls):
+        if prompts and rng.random() < repeat:
+            prompts.append(rng.choice(prompts))
+        else:
+            prompts.append(f"prompt number {index}, a fox in the snow")
+    return prompts
+
+
+async def per_call_client(url: str, prompt: str) -> str:
+    async with httpx.AsyncClient() as client:
+        response = await client.post(
+            url,
+            json={"model": "stub", "messages": [{"role": "user", "content": TEMPLATE.format(prompt=prompt)}]},
+            timeout=30.0,
+        )
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+
+async def run(args):
+    prompts = workload(args.calls, args.repeat, args.seed)
+    results = {}
+
+    server = await StubLLMServer(args.latency, fail_every=0).start()
+    started = time.perf_counter()
+    await asyncio.gather(*(per_call_client(server.url, prompt) for prompt in prompts))
+    results["per-call client"] = (time.perf_counter() - started, server.requests, server.connections, 0)
+    await server.stop()
+
+    server = await StubLLMServer(args.latency, fail_every=args.fail_every).start()
+    cache_path = os.path.join(tempfile.mkdtemp(prefix="bench_llm_"), "cache.sqlite3")
+    client = LLMClient(server.url, "bench", cache_path=cache_path, max_concurrency=args.concurrency)
+    started = time.perf_counter()
+    await asyncio.gather(*(client.complete("stub", TEMPLATE, prompt) for prompt in prompts))
+    elapsed = time.perf_counter() - started
+    results["LLMClient"] = (elapsed, server.requests, server.connections, client.retries)
+
+    # Second pass: everything is cached now.
+    started = time.perf_counter()
+    await asyncio.gather(*(client.complete("stub", TEMPLATE, prompt) for prompt in prompts))
+    results["LLMClient (warm)"] = (time.perf_counter() - started, server.requests, server.connections, client.retries)
+    await client.aclose()
+    await server.stop()
+
+    print(f"{len(prompts)} calls, {len(set(prompts))} distinct prompts, stub latency {args.latency}s")
+    print(f"{'variant':<18} {'wall':>8} {'requests':>9} {'conns':>6} {'retries':>8}")
+    for name, (wall, requests, connections, retries) in results.items():
+        print(f"{name:<18} {wall:>7.2f}s {requests:>9} {connections:>6} {retries:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=40)
+    parser.add_argument("--repeat", type=float, default=0.3, help="share of calls that reuse an earlier prompt")
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--fail-every", type=int, default=7, help="stub answers every Nth request with 429")
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,137 @@
+"""Prompt expansion micro-benchmark: compiled PromptExpander vs the old regex fixed-point loop.
+
+Builds a synthetic table of keywords (some referencing each other) and wildcards
+nested --depth levels deep, checks both implementations produce identical prompts
+for the same random seed, then times preprocess_prompt-style requests (four
+expansions sharing one token cache) and the one-off compile cost.
+
+    python benchmarks/bench_prompt.py --keywords 500 --wildcards 100 --depth 8 --requests 2000
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+KEY_TOKEN = re.compile(r"\{([^{}]+)\}")
+
+
+def legacy_replace(text, keywords, wildcards, cache=None):
+    """The pre-compilation implementation, kept here as the baseline."""
+    if not text:
+        return ""
+    cache = {} if cache is None else cache
+
+    def substitute(match):
+        key = match.group(1).strip()
+        if not key:
+            return match.group(0)
+        if key in cache:
+            return cache[key]
+        if key in keywords:
+            cache[key] = legacy_replace(keywords[key], keywords, wildcards, cache)
+        elif key in wildcards:
+            options = [option for option in wildcards[key] if option.strip(" ,")]
+            selection = random.choice(options) if options else ""
+            cache[key] = legacy_replace(selection, keywords, wildcards, cache)
+        else:
+            cache[key] = match.group(0)
+        return cache[key]
+
+    previous = None
+    current = text
+    while current != previous:
+        previous = current
+        current = KEY_TOKEN.sub(substitute, current)
+    return current
+
+
+def build_tables(n_keywords, n_wildcards, depth, seed):
+    rng = random.Random(seed)
+    keywords = {}
+    for index in range(n_keywords):
+        refs = [f"{{kw{rng.randrange(index)}}}" for _ in range(min(index, rng.randrange(3)))]
+        keywords[f"kw{index}"] = ", ".join([f"tag{index}a", f"tag{index}b", *refs])
+    wildcards = {}
+    for index in range(n_wildcards):
+        chain = index % depth
+        options = [f"option{index}_{choice}" for choice in range(5)]
+        if chain:
+            options.append(f"{{wc{index - 1}}}, extra{index}")
+        options.append(f"{{kw{rng.randrange(n_keywords)}}}")
+        wildcards[f"wc{index}"] = options
+    return keywords, wildcards
+
+
+def build_prompts(count, keywords, wildcards, seed):
+    rng = random.Random(seed + 1)
+    names = list(keywords) + list(wildcards)
+    prompts = []
+    for _ in range(count):
+        tokens = [f"{{{rng.choice(names)}}}" for _ in range(rng.randrange(1, 6))]
+        prompts.append(", ".join(["masterpiece", *tokens, "{unknown}", "sunset"]))
+    return prompts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keywords", type=int, default=500)
+    parser.add_argument("--wildcards", type=int, default=100)
+    parser.add_argument("--depth", type=int, default=8, help="wildcard nesting depth")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # vars.py reads api_keys.yaml from the working directory.
+    workdir = tempfile.mkdtemp(prefix="bench_prompt_")
+    with open(os.path.join(workdir, "api_keys.yaml"), "w") as handle:
+        handle.write("DISCORD_TOKEN: bench\nOPENROUTER_API_KEY: bench\nCHANNEL_ID: 1\n")
+    os.chdir(workdir)
+    from prompt_processing import PromptExpander
+
+    keywords, wildcards = build_tables(args.keywords, args.wildcards, args.depth, args.seed)
+    negative = "{kw1}, {kw2}, lowres, bad anatomy"
+    prompts = build_prompts(args.requests, keywords, wildcards, args.seed)
+
+    started = time.perf_counter()
+    expander = PromptExpander(keywords, wildcards, negative)
+    compile_seconds = time.perf_counter() - started
+
+    def legacy_request(prompt):
+        cache = {}
+        return [legacy_replace(text, keywords, wildcards, cache) for text in (prompt, prompt, "", negative)]
+
+    def compiled_request(prompt):
+        cache = {}
+        texts = [expander.expand(text, cache) for text in (prompt, prompt, "")]
+        return texts + [expander.default_negative if expander.default_negative is not None else expander.expand(negative, cache)]
+
+    mismatches = 0
+    for index, prompt in enumerate(prompts[:200]):
+        random.seed(index)
+        expected = legacy_request(prompt)
+        random.seed(index)
+        mismatches += compiled_request(prompt) != expected
+
+    timings = {}
+    for name, request in (("legacy", legacy_request), ("compiled", compiled_request)):
+        random.seed(args.seed)
+        started = time.perf_counter()
+        for prompt in prompts:
+            request(prompt)
+        timings[name] = time.perf_counter() - started
+
+    print(f"{args.keywords} keywords, {args.wildcards} wildcards (depth {args.depth}), {args.requests} requests")
+    print(f"compile: {compile_seconds * 1000:.2f} ms, {len(expander.cyclic)} cyclic keys, mismatches: {mismatches}/200")
+    for name, seconds in timings.items():
+        print(f"{name:<9} {seconds * 1e6 / len(prompts):8.1f} us/request")
+    print(f"speedup  {timings['legacy'] / timings['compiled']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
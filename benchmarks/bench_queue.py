@@ -0,0 +1,342 @@
+"""End-to-end queue throughput benchmark against a fake ComfyUI backend.
+
+Drives discord_bot's real queue worker with stub Discord interactions/messages and
+synthetic node delays, then reports jobs/sec, queue-wait and end-to-end latency
+percentiles and per-stage time.
+
+    python benchmarks/bench_queue.py --jobs 40 --rate 0 --mix imagine=6,reroll=3,upscale=1
+    python benchmarks/bench_queue.py --json run.json   # save results to compare runs
+    python benchmarks/bench_queue.py --workers 2       # dispatch to two CPU-only stub worker processes
+    PYTHONPATH=benchmarks python engine.py --preload fake_comfy:install --socket /tmp/engine.sock &
+    python benchmarks/bench_queue.py --engine-socket /tmp/engine.sock   # against a running stub engine
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_comfy  # noqa: E402
+
+PROMPTS = [
+    "1girl, silver hair, city street at night, neon lights",
+    "a cat sleeping on a windowsill, morning sun",
+    "{yuri}, sitting in {place}, {style}",
+    "mountain village at sunrise, river, detailed background",
+    "portrait of an old fisherman, dramatic lighting, film grain",
+]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Latency:
+    edit = 0.15
+    send = 0.2
+    reaction = 0.12
+    defer = 0.1
+
+
+class FakeMessage:
+    _ids = itertools.count(1)
+
+    def __init__(self, channel, content=None):
+        self.id = next(self._ids)
+        self.channel = channel
+        self.content = content
+        self.attachments = []
+        self.reactions = []
+
+    async def edit(self, content=None, attachments=None):
+        await asyncio.sleep(Latency.edit)
+        if content is not None:
+            self.content = content
+        if attachments is not None:
+            self.attachments = attachments
+
+    async def add_reaction(self, emoji):
+        await asyncio.sleep(Latency.reaction)
+        self.reactions.append(emoji)
+
+    async def delete(self):
+        await asyncio.sleep(Latency.edit)
+
+
+class FakeChannel:
+    id = 1
+
+    async def send(self, content=None, **kwargs):
+        await asyncio.sleep(Latency.send)
+        return FakeMessage(self, content)
+
+
+class FakeResponse:
+    def __init__(self):
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def defer(self, thinking=False):
+        await asyncio.sleep(Latency.defer)
+        self._done = True
+
+
+class FakeFollowup:
+    def __init__(self, channel):
+        self._channel = channel
+
+    async def send(self, content=None, **kwargs):
+        return await self._channel.send(content=content, **kwargs)
+
+
+def make_interaction_class(discord):
+    class FakeInteraction(discord.Interaction):
+        """Interaction that passes isinstance checks without a gateway connection."""
+
+        def __init__(self, channel, user_id):  # noqa: D401 - deliberately skips Interaction.__init__
+            self._fake_channel = channel
+            self._fake_response = FakeResponse()
+            self._fake_followup = FakeFollowup(channel)
+            self._fake_user_id = user_id
+
+        @property
+        def channel(self):
+            return self._fake_channel
+
+        @property
+        def channel_id(self):
+            return self._fake_channel.id
+
+        @property
+        def response(self):
+            return self._fake_response
+
+        @property
+        def followup(self):
+            return self._fake_followup
+
+    return FakeInteraction
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - {"imagine", "reroll", "upscale"}
+    if unknown:
+        raise SystemExit(f"unknown job kinds in --mix: {', '.join(sorted(unknown))}")
+    return mix
+
+
+def build_job(bot, kind: str, rng: random.Random, channel, interaction_cls, user_id: int):
+    from PIL import Image
+
+    prompt = rng.choice(PROMPTS)
+    processed = bot.preprocess_prompt(prompt, None, [])
+    base_args = {
+        "prompt": processed["prompt"],
+        "neg_prompt": processed["neg_prompt"],
+        "display_prompt": processed["display_prompt"],
+    }
+    if kind == "upscale":
+        source = FakeMessage(channel)
+        width, height = bot.txt2img_args["width"], bot.txt2img_args["height"]
+        preset = bot.upscale_weak_args if rng.random() < 0.7 else bot.upscale_hard_args
+        gen_args = bot.preprocess_gen_args(base_args, preset)
+        return bot.ImageJob(
+            source, gen_args, user_id, job_type="upscale", base_images=[Image.new("RGB", (width, height), (90, 120, 160))],
+        )
+
+    base_args["batch_size"] = rng.choice([1, 1, 1, 2, 4])
+    gen_args = bot.preprocess_gen_args(base_args, bot.txt2img_args)
+    if kind == "reroll":
+        return bot.ImageJob(FakeMessage(channel), gen_args, user_id)
+    interaction = interaction_cls(channel, user_id)
+    interaction.response._done = True
+    return bot.ImageJob(interaction, gen_args, user_id, deferred=True)
+
+
+def instrument(bot, stage_seconds, job_times):
+    """Wrap the pipeline stage functions to record per-stage time and per-job timestamps."""
+    prepare_batch, run_batch, publish_result = bot.prepare_batch, bot.run_batch, bot.publish_result
+    encode_images = bot.image_io.encode_images
+
+    async def timed_prepare(jobs):
+        now = time.perf_counter()
+        for job in jobs:
+            job_times[id(job)]["started"] = now
+        prepared = await prepare_batch(jobs)
+        stage_seconds["prepare"] += time.perf_counter() - now
+        return prepared
+
+    async def timed_run(jobs):
+        start = time.perf_counter()
+        try:
+            return await run_batch(jobs)
+        finally:
+            stage_seconds["gpu"] += time.perf_counter() - start
+            stage_seconds["gpu_batches"] += 1
+
+    async def timed_publish(job, progress_msg, images):
+        start = time.perf_counter()
+        try:
+            return await publish_result(job, progress_msg, images)
+        finally:
+            now = time.perf_counter()
+            stage_seconds["publish"] += now - start
+            job_times[id(job)]["finished"] = now
+
+    async def timed_encode(images, mode=None):
+        start = time.perf_counter()
+        try:
+            return await encode_images(images, mode)
+        finally:
+            stage_seconds["encode"] += time.perf_counter() - start
+
+    bot.prepare_batch, bot.run_batch, bot.publish_result = timed_prepare, timed_run, timed_publish
+    bot.image_io.encode_images = timed_encode
+
+
+async def run(args):
+    import discord
+    import discord_bot as bot
+
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    kinds, weights = zip(*mix.items())
+    channel = FakeChannel()
+    interaction_cls = make_interaction_class(discord)
+
+    stage_seconds = defaultdict(float)
+    job_times = defaultdict(dict)
+    instrument(bot, stage_seconds, job_times)
+    engine = asyncio.create_task(bot.start_engine())
+
+    worker = asyncio.create_task(bot.queue_worker())
+    jobs = []
+    start = time.perf_counter()
+    for index in range(args.jobs):
+        kind = rng.choices(kinds, weights)[0]
+        job = build_job(bot, kind, rng, channel, interaction_cls, user_id=index % args.users)
+        job_times[id(job)].update(kind=kind, enqueued=time.perf_counter())
+        jobs.append(job)
+        await bot.job_queue.put(job)
+        if args.rate > 0:
+            await asyncio.sleep(rng.expovariate(args.rate))
+    await bot.job_queue.join()
+    elapsed = time.perf_counter() - start
+    worker.cancel()
+    await engine
+    worker_stats = {}
+    if bot.worker_pool is not None:
+        worker_stats = bot.worker_pool.stats()
+        await bot.worker_pool.close()
+
+    waits = [t["started"] - t["enqueued"] for t in job_times.values() if "started" in t]
+    latencies = [t["finished"] - t["enqueued"] for t in job_times.values() if "finished" in t]
+    by_kind = defaultdict(list)
+    for t in job_times.values():
+        if "finished" in t:
+            by_kind[t["kind"]].append(t["finished"] - t["enqueued"])
+
+    return {
+        "jobs": args.jobs,
+        "completed": len(latencies),
+        "elapsed_s": elapsed,
+        "jobs_per_s": len(latencies) / elapsed if elapsed else 0.0,
+        "queue_wait_s": {f"p{p}": percentile(waits, p) for p in (50, 95, 99)},
+        "latency_s": {f"p{p}": percentile(latencies, p) for p in (50, 95, 99)},
+        "latency_by_kind_p50_s": {kind: percentile(values, 50) for kind, values in by_kind.items()},
+        "stage_s": dict(stage_seconds),
+        "node_s": dict(fake_comfy.stats.seconds),
+        "node_calls": dict(fake_comfy.stats.calls),
+        "workers": worker_stats,
+    }
+
+
+def print_report(result):
+    print(f"jobs: {result['completed']}/{result['jobs']} in {result['elapsed_s']:.2f}s "
+          f"({result['jobs_per_s']:.2f} jobs/s)")
+    for label, key in (("queue wait", "queue_wait_s"), ("end-to-end", "latency_s")):
+        values = result[key]
+        print(f"{label:>11}: p50 {values['p50']:.2f}s  p95 {values['p95']:.2f}s  p99 {values['p99']:.2f}s")
+    for kind, value in sorted(result["latency_by_kind_p50_s"].items()):
+        print(f"{kind:>11}: p50 {value:.2f}s")
+    print("stages:")
+    for name, seconds in sorted(result["stage_s"].items()):
+        print(f"  {name:<14} {seconds:8.2f}")
+    print("fake nodes:")
+    for name, seconds in sorted(result["node_s"].items()):
+        print(f"  {name:<14} {seconds:8.2f}s  ({result['node_calls'][name]} calls)")
+    if result["workers"]:
+        print("workers: " + ", ".join(f"{name} {value}" for name, value in result["workers"].items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=30)
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=0.0, help="Poisson arrivals per second; 0 enqueues everything at once")
+    parser.add_argument("--mix", default="imagine=6,reroll=3,upscale=1")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--comfy-import", type=float, default=fake_comfy.delays.comfy_import)
+    parser.add_argument("--checkpoint-load", type=float, default=fake_comfy.delays.checkpoint_load)
+    parser.add_argument("--lora-load", type=float, default=fake_comfy.delays.lora_load)
+    parser.add_argument("--clip-encode", type=float, default=fake_comfy.delays.clip_encode)
+    parser.add_argument("--sample-per-step-mp", type=float, default=fake_comfy.delays.sample_per_step_mp)
+    parser.add_argument("--vae-decode-per-mp", type=float, default=fake_comfy.delays.vae_decode_per_mp)
+    parser.add_argument("--discord-latency", type=float, default=None, help="override all fake Discord call latencies")
+    parser.add_argument("--workers", type=int, default=0, help="run generation in N stub worker processes")
+    parser.add_argument("--engine-socket", action="append", default=[], help="engine server socket to dispatch to")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    fake_comfy.delays.comfy_import = args.comfy_import
+    fake_comfy.delays.checkpoint_load = args.checkpoint_load
+    fake_comfy.delays.lora_load = args.lora_load
+    fake_comfy.delays.clip_encode = args.clip_encode
+    fake_comfy.delays.sample_per_step_mp = args.sample_per_step_mp
+    fake_comfy.delays.vae_decode_per_mp = args.vae_decode_per_mp
+    if args.discord_latency is not None:
+        Latency.edit = Latency.send = Latency.reaction = Latency.defer = args.discord_latency
+    fake_comfy.install()
+    fake_comfy.export_delays()
+
+    # vars.py reads api_keys.yaml from the working directory.
+    workdir = tempfile.mkdtemp(prefix="bench_queue_")
+    with open(os.path.join(workdir, "api_keys.yaml"), "w") as handle:
+        handle.write("DISCORD_TOKEN: bench\nOPENROUTER_API_KEY: bench\nCHANNEL_ID: 1\n")
+    os.chdir(workdir)
+    if args.workers or args.engine_socket:
+        import vars
+
+        vars.WORKER_DEVICES = [None] * args.workers
+        vars.WORKER_PRELOAD = "fake_comfy:install"
+        vars.ENGINE_SOCKETS = args.engine_socket
+
+    result = asyncio.run(run(args))
+    print_report(result)
+    if args.json:
+        with open(os.path.join(ROOT, args.json) if not os.path.isabs(args.json) else args.json, "w") as handle:
+            json.dump(result, handle, indent=2)
+
+
+if __name__ == "__main__":
+    main()
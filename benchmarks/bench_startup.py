@@ -0,0 +1,91 @@
+"""Bot startup benchmark and import-time budget check against the fake ComfyUI backend.
+
+Each run starts a fresh interpreter and times `import discord_bot` (the point where the
+client could start connecting), then start_engine() until jobs can run. "eager" imports
+ComfyUI and loads the model before connecting, as the bot used to; "lazy" is the
+current behaviour, where that work happens in the background after connecting.
+Exits non-zero when the lazy import time exceeds --budget or pulls in torch/ComfyUI.
+
+    python benchmarks/bench_startup.py --runs 3 --budget 1.0
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CHILD = r"""
+import asyncio, json, sys, time
+started = time.perf_counter()
+sys.path[:0] = [{root!r}, {bench!r}]
+eager = {eager!r}
+if eager:
+    import fake_comfy
+    fake_comfy.install()
+    import imagegen
+    imagegen.warm_up()
+import discord_bot
+imported = time.perf_counter()
+heavy = sorted(name for name in ("torch", "nodes", "imagegen") if name in sys.modules)
+if not eager:
+    import fake_comfy
+    fake_comfy.install()
+asyncio.run(discord_bot.start_engine())
+ready = time.perf_counter()
+print(json.dumps({{"import": imported - started, "ready": ready - started, "heavy": heavy,
+                  "engine": discord_bot.startup_timings}}))
+"""
+
+
+def run_child(eager: bool, env: dict, workdir: str) -> dict:
+    code = CHILD.format(root=ROOT, bench=BENCH_DIR, eager=eager)
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=workdir, env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--budget", type=float, default=1.0, help="max median seconds for `import discord_bot`")
+    parser.add_argument("--comfy-import", type=float, default=3.0)
+    parser.add_argument("--checkpoint-load", type=float, default=2.0)
+    args = parser.parse_args()
+
+    # vars.py reads api_keys.yaml from the working directory.
+    workdir = tempfile.mkdtemp(prefix="bench_startup_")
+    with open(os.path.join(workdir, "api_keys.yaml"), "w") as handle:
+        handle.write("DISCORD_TOKEN: bench\nOPENROUTER_API_KEY: bench\nCHANNEL_ID: 1\n")
+    env = dict(os.environ, FAKE_COMFY_DELAYS=json.dumps({
+        "comfy_import": args.comfy_import, "checkpoint_load": args.checkpoint_load,
+    }))
+
+    results = {}
+    for mode in ("eager", "lazy"):
+        results[mode] = [run_child(mode == "eager", env, workdir) for _ in range(args.runs)]
+
+    print(f"{args.runs} runs, fake ComfyUI import {args.comfy_import}s, checkpoint load {args.checkpoint_load}s")
+    print(f"{'mode':<6} {'connect after':>14} {'engine ready':>13}  heavy modules at connect")
+    for mode, runs in results.items():
+        imported = statistics.median(run["import"] for run in runs)
+        ready = statistics.median(run["ready"] for run in runs)
+        print(f"{mode:<6} {imported:>13.2f}s {ready:>12.2f}s  {', '.join(runs[0]['heavy']) or '-'}")
+    engine = results["lazy"][-1]["engine"]
+    print("lazy startup timings: " + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in engine.items()))
+
+    lazy_import = statistics.median(run["import"] for run in results["lazy"])
+    heavy = results["lazy"][0]["heavy"]
+    if lazy_import > args.budget or heavy:
+        print(f"FAIL: import took {lazy_import:.2f}s (budget {args.budget:.2f}s), heavy modules: {heavy or 'none'}")
+        sys.exit(1)
+    print(f"OK: import {lazy_import:.2f}s within {args.budget:.2f}s budget")
+
+
+if __name__ == "__main__":
+    main()
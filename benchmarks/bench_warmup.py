@@ -0,0 +1,87 @@
+"""Startup warm-up benchmark: first-job latency per preset with and without warm-up samples.
+
+Uses the fake ComfyUI backend with a one-off cost the first time each latent shape is
+sampled (standing in for CUDA kernel selection, cuDNN autotune and allocator growth),
+and pretends to have a GPU so imagegen's warm-up path runs. For each mode it times
+warm_up(), then one txt2img, weak and hard upscale per dimension preset.
+
+    python benchmarks/bench_warmup.py --first-shape 1.0 --dimensions 896x1152,1024x1024
+    python benchmarks/bench_warmup.py --compile   # also exercise the torch.compile patch
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_comfy  # noqa: E402
+
+
+def first_jobs(imagegen, vars):
+    """Latency of the first txt2img/weak/hard job at every warm-up size."""
+    latencies = {}
+    prompt = {"prompt": "a lighthouse at dusk", "neg_prompt": "", "seed": 1}
+    for width, height in imagegen._warmup_sizes():
+        started = time.perf_counter()
+        images = imagegen.generate_images_batch([dict(vars.txt2img_args, **prompt, width=width, height=height)])[0]
+        latencies[f"txt2img {width}x{height}"] = time.perf_counter() - started
+        for name, preset in (("weak", vars.upscale_weak_args), ("hard", vars.upscale_hard_args)):
+            started = time.perf_counter()
+            imagegen.upscale_images(images[:1], dict(preset, **prompt))
+            latencies[f"{name} {width}x{height}"] = time.perf_counter() - started
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--first-shape", type=float, default=1.0, help="fake one-off cost per new latent shape")
+    parser.add_argument("--dimensions", help="comma-separated DIMENSION_PRESETS names (default: all)")
+    parser.add_argument("--compile", action="store_true", help="enable TORCH_COMPILE")
+    args = parser.parse_args()
+
+    fake_comfy.delays.first_shape = args.first_shape
+    fake_comfy.delays.comfy_import = 0.0
+    fake_comfy.install()
+
+    # vars.py reads api_keys.yaml from the working directory.
+    workdir = tempfile.mkdtemp(prefix="bench_warmup_")
+    with open(os.path.join(workdir, "api_keys.yaml"), "w") as handle:
+        handle.write("DISCORD_TOKEN: bench\nOPENROUTER_API_KEY: bench\nCHANNEL_ID: 1\n")
+    os.chdir(workdir)
+    import imagegen
+    import vars
+
+    if args.dimensions:
+        vars.WARMUP_DIMENSIONS = [name.strip() for name in args.dimensions.split(",")]
+    vars.TORCH_COMPILE = args.compile
+    imagegen.reload_config()
+    imagegen._accelerated = lambda: True
+
+    results = {}
+    for mode, samples in (("cold", False), ("warmed", True)):
+        fake_comfy._seen_shapes.clear()
+        imagegen.invalidate_model_cache()
+        started = time.perf_counter()
+        timings = imagegen.warm_up(samples=samples)
+        warm_seconds = time.perf_counter() - started
+        results[mode] = (warm_seconds, timings.get("warmup_jobs", 0), first_jobs(imagegen, vars))
+
+    print(f"{len(imagegen._warmup_sizes())} sizes, first-shape cost {args.first_shape}s, compile {args.compile}")
+    print(f"{'mode':<7} {'warm-up':>8} {'dummy jobs':>11} {'first job p50':>14} {'max':>7} {'sum':>7}")
+    for mode, (warm_seconds, jobs, latencies) in results.items():
+        values = list(latencies.values())
+        print(f"{mode:<7} {warm_seconds:>7.2f}s {jobs:>11} {statistics.median(values):>13.2f}s "
+              f"{max(values):>6.2f}s {sum(values):>6.2f}s")
+    cold, warmed = results["cold"][2], results["warmed"][2]
+    print("per job (cold -> warmed):")
+    for name in cold:
+        print(f"  {name:<18} {cold[name]:6.2f}s -> {warmed[name]:6.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""Stand-in ComfyUI modules so imagegen/discord_bot can be driven without a GPU.
+
+Call install() before importing imagegen. Every node sleeps for a configurable
+synthetic delay and returns small-but-correctly-shaped CPU tensors, so the
+surrounding bot code (caching, batching, encoding, publishing) runs for real.
+"""
+import importlib.abc
+import importlib.util
+import json
+import os
+import sys
+import time
+import types
+from dataclasses import asdict, dataclass, field
+from typing import Dict
+
+import torch
+
+
+@dataclass
+class FakeDelays:
+    comfy_import: float = 3.0  # paid once, when `nodes` is first imported
+    checkpoint_load: float = 2.0
+    lora_load: float = 0.3
+    clip_encode: float = 0.05
+    sample_per_step_mp: float = 0.04  # seconds per step per megapixel of latent batch
+    vae_decode_per_mp: float = 0.05
+    vae_encode_per_mp: float = 0.04
+    first_shape: float = 0.0  # one-off cost the first time a latent shape is sampled (kernel autotune)
+
+
+@dataclass
+class FakeStats:
+    calls: Dict[str, int] = field(default_factory=dict)
+    seconds: Dict[str, float] = field(default_factory=dict)
+
+    def record(self, name: str, seconds: float):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+
+delays = FakeDelays()
+stats = FakeStats()
+_progress_hook = None
+_seen_shapes = set()
+
+
+def _sleep(name: str, seconds: float):
+    time.sleep(seconds)
+    stats.record(name, seconds)
+
+
+def _megapixels(samples: torch.Tensor) -> float:
+    # Latents are 1/8 of the pixel size per side.
+    batch, _, height, width = samples.shape
+    return batch * height * 8 * width * 8 / 1_000_000
+
+
+class _Model:
+    def __init__(self):
+        self.object_patches = {}
+
+    def clone(self):
+        model = _Model()
+        model.object_patches = dict(self.object_patches)
+        return model
+
+    def get_model_object(self, name):
+        return self.object_patches.get(name) or torch.nn.Identity()
+
+    def add_object_patch(self, name, obj):
+        self.object_patches[name] = obj
+
+
+class _Clip:
+    pass
+
+
+class _Vae:
+    pass
+
+
+class CheckpointLoaderSimple:
+    def load_checkpoint(self, name):
+        _sleep("checkpoint_load", delays.checkpoint_load)
+        return _Model(), _Clip(), _Vae()
+
+
+class UNETLoader:
+    def load_unet(self, name, dtype):
+        _sleep("checkpoint_load", delays.checkpoint_load * 0.6)
+        return (_Model(),)
+
+
+class CLIPLoader:
+    def load_clip(self, name, kind, device):
+        _sleep("checkpoint_load", delays.checkpoint_load * 0.3)
+        return (_Clip(),)
+
+
+class VAELoader:
+    def load_vae(self, name):
+        _sleep("checkpoint_load", delays.checkpoint_load * 0.1)
+        return (_Vae(),)
+
+
+class LoraLoader:
+    def load_lora(self, model, clip, name, strength_model, strength_clip):
+        _sleep("lora_load", delays.lora_load)
+        return _Model(), _Clip()
+
+
+class CLIPTextEncode:
+    def encode(self, clip, text):
+        _sleep("clip_encode", delays.clip_encode)
+        tokens = 77 * (1 + len(text) // 300)
+        return ([[torch.zeros(1, tokens, 8), {"pooled_output": torch.zeros(1, 8)}]],)
+
+
+class ConditioningSetTimestepRange:
+    def set_range(self, conditioning, start, end):
+        return ([[tensor, dict(extras, start_percent=start, end_percent=end)] for tensor, extras in conditioning],)
+
+
+class EmptyLatentImage:
+    channels = 4
+
+    def generate(self, width, height, batch_size=1):
+        return ({"samples": torch.zeros(batch_size, self.channels, height // 8, width // 8)},)
+
+
+class EmptySD3LatentImage(EmptyLatentImage):
+    channels = 16
+
+
+def _run_steps(samples: torch.Tensor, steps: int, denoise: float):
+    if tuple(samples.shape) not in _seen_shapes:
+        _seen_shapes.add(tuple(samples.shape))
+        _sleep("first_shape", delays.first_shape)
+    active = max(1, int(round(steps * denoise))) if denoise < 1.0 else steps
+    per_step = delays.sample_per_step_mp * _megapixels(samples)
+    for step in range(1, active + 1):
+        time.sleep(per_step)
+        if _progress_hook is not None:
+            _progress_hook(step, active, None)
+    stats.record("ksampler", per_step * active)
+
+
+class KSampler:
+    def sample(self, model, seed, steps, cfg, sampler_name, scheduler, positive, negative, latent_image, denoise=1.0):
+        samples = latent_image["samples"]
+        _run_steps(samples, steps, denoise)
+        return ({"samples": samples + 0.5},)
+
+
+class VAEDecode:
+    def decode(self, vae, samples):
+        latent = samples["samples"]
+        _sleep("vae_decode", delays.vae_decode_per_mp * _megapixels(latent))
+        batch, _, height, width = latent.shape
+        ramp_x = torch.linspace(0.0, 1.0, width * 8).view(1, 1, -1, 1)
+        ramp_y = torch.linspace(0.0, 1.0, height * 8).view(1, -1, 1, 1)
+        image = (ramp_x * 0.6 + ramp_y * 0.4).expand(batch, height * 8, width * 8, 3).contiguous()
+        return (image,)
+
+
+class VAEEncode:
+    def encode(self, vae, pixels):
+        batch, height, width, _ = pixels.shape
+        latent = torch.zeros(batch, 4, height // 8, width // 8)
+        _sleep("vae_encode", delays.vae_encode_per_mp * _megapixels(latent))
+        return ({"samples": latent},)
+
+
+class LatentUpscale:
+    def upscale(self, samples, upscale_method, width, height, crop):
+        latent = samples["samples"]
+        resized = torch.nn.functional.interpolate(latent, size=(height // 8, width // 8), mode="nearest")
+        return ({**samples, "samples": resized},)
+
+
+NODE_CLASS_MAPPINGS = {
+    "CheckpointLoaderSimple": CheckpointLoaderSimple,
+    "CLIPTextEncode": CLIPTextEncode,
+    "KSampler": KSampler,
+    "VAEDecode": VAEDecode,
+    "EmptyLatentImage": EmptyLatentImage,
+    "LoraLoader": LoraLoader,
+    "VAEEncode": VAEEncode,
+    "UNETLoader": UNETLoader,
+    "CLIPLoader": CLIPLoader,
+    "VAELoader": VAELoader,
+    "ConditioningSetTimestepRange": ConditioningSetTimestepRange,
+    "LatentUpscale": LatentUpscale,
+}
+
+
+def _set_progress_bar_global_hook(hook):
+    global _progress_hook  # noqa: PLW0603
+    _progress_hook = hook
+
+
+def _prepare_noise(latent_image, seed, batch_inds=None):
+    generator = torch.manual_seed(seed)
+    return torch.randn(latent_image.size(), generator=generator)
+
+
+def _sample(model, noise, steps, cfg, sampler_name, scheduler, positive, negative, latent_image, denoise=1.0, **kwargs):
+    _run_steps(latent_image, steps, denoise)
+    return latent_image + 0.5
+
+
+class _SlowImport(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+    """Serves a prebuilt module on first import after sleeping, like ComfyUI's `nodes`."""
+
+    def __init__(self, module: types.ModuleType):
+        self.module = module
+
+    def find_spec(self, name, path, target=None):
+        if name == self.module.__name__:
+            return importlib.util.spec_from_loader(name, self)
+        return None
+
+    def create_module(self, spec):
+        _sleep("comfy_import", delays.comfy_import)
+        return self.module
+
+    def exec_module(self, module):
+        pass
+
+
+def _module(name: str, **attrs) -> types.ModuleType:
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    return module
+
+
+def install():
+    """Register the fake ComfyUI modules in sys.modules.
+
+    Delay overrides can come from FAKE_COMFY_DELAYS (JSON), so worker processes
+    started with --preload fake_comfy:install match the parent's settings.
+    """
+    for name, value in json.loads(os.environ.get("FAKE_COMFY_DELAYS", "{}")).items():
+        setattr(delays, name, value)
+    comfy = _module("comfy")
+    comfy.utils = _module(
+        "comfy.utils",
+        set_progress_bar_global_hook=_set_progress_bar_global_hook,
+        PROGRESS_BAR_ENABLED=True,
+    )
+    comfy.model_management = _module(
+        "comfy.model_management",
+        unload_all_models=lambda: None,
+        soft_empty_cache=lambda *args, **kwargs: None,
+    )
+    comfy.sample = _module(
+        "comfy.sample",
+        prepare_noise=_prepare_noise,
+        sample=_sample,
+        fix_empty_latent_channels=lambda model, latent: latent,
+    )
+    comfy_extras = _module("comfy_extras")
+    comfy_extras.nodes_sd3 = _module("comfy_extras.nodes_sd3", EmptySD3LatentImage=EmptySD3LatentImage)
+    modules = {
+        "folder_paths": _module("folder_paths", get_full_path=lambda kind, name: name),
+        "latent_preview": _module("latent_preview", prepare_callback=lambda model, steps: None),
+        "comfy": comfy,
+        "comfy.utils": comfy.utils,
+        "comfy.model_management": comfy.model_management,
+        "comfy.sample": comfy.sample,
+        "comfy_extras": comfy_extras,
+        "comfy_extras.nodes_sd3": comfy_extras.nodes_sd3,
+    }
+    sys.modules.update(modules)
+    sys.modules.pop("nodes", None)
+    sys.meta_path.insert(0, _SlowImport(_module("nodes", NODE_CLASS_MAPPINGS=NODE_CLASS_MAPPINGS)))
+
+
+def export_delays():
+    """Pass the current delays on to child processes via FAKE_COMFY_DELAYS."""
+    os.environ["FAKE_COMFY_DELAYS"] = json.dumps(asdict(delays))
@@ -0,0 +1,95 @@
+"""Local stand-in for the OpenRouter chat-completions endpoint.
+
+Answers POST /api/v1/chat/completions with "enhanced: <last user message>" after a
+configurable delay, optionally failing every Nth request with 429 or 500, and counts
+requests and TCP connections so connection reuse can be checked. Run standalone and
+point LLM_API_URL at it to exercise the bot without an API key:
+
+    python benchmarks/stub_llm.py --port 8089 --latency 0.5
+"""
+import argparse
+import asyncio
+import json
+from typing import Optional
+
+
+class StubLLMServer:
+    def __init__(self, latency: float = 0.0, fail_every: int = 0, fail_status: int = 429):
+        self.latency = latency
+        self.fail_every = fail_every
+        self.fail_status = fail_status
+        self.requests = 0
+        self.connections = 0
+        self.failures = 0
+        self.port: Optional[int] = None
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/api/v1/chat/completions"
+
+    async def start(self, port: int = 0) -> "StubLLMServer":
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                headers = {}
+                for line in head.decode("latin-1").split("\r\n")[1:]:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                status, payload = await self._respond(body)
+                data = json.dumps(payload).encode()
+                extra = "Retry-After: 0\r\n" if status == 429 else ""
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                    f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n{extra}\r\n".encode() + data,
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, body: bytes):
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        if self.fail_every and self.requests % self.fail_every == 0:
+            self.failures += 1
+            return self.fail_status, {"error": {"message": "stub failure", "code": self.fail_status}}
+        request = json.loads(body or b"{}")
+        prompt = request.get("messages", [{}])[-1].get("content", "")
+        return 200, {
+            "id": f"stub-{self.requests}",
+            "object": "chat.completion",
+            "model": request.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": f"enhanced: {prompt[-200:]}"}}],
+        }
+
+
+async def _serve(args):
+    server = await StubLLMServer(args.latency, args.fail_every, args.fail_status).start(args.port)
+    print(f"stub LLM listening on {server.url}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--fail-every", type=int, default=0)
+    parser.add_argument("--fail-status", type=int, default=429)
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
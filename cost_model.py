@@ -0,0 +1,79 @@
+import json
+import os
+import threading
+from typing import Dict, Optional, Sequence, Tuple
+
+Key = Tuple[str, str, int, str]
+
+
+def job_work(job_type: str, gen_args: dict, base_size: Optional[Tuple[int, int]] = None) -> float:
+    """GPU work of a job in megapixel-steps (sampled steps x output megapixels x batch)."""
+    if job_type == "upscale" and base_size is not None:
+        scale = gen_args.get("scale", 1.0)
+        megapixels = base_size[0] * base_size[1] * scale * scale / 1_000_000
+        return megapixels * gen_args.get("steps", 1) * gen_args.get("denoising_strength", 1.0)
+    megapixels = gen_args.get("width", 0) * gen_args.get("height", 0) / 1_000_000
+    return megapixels * gen_args.get("steps", 1) * gen_args.get("batch_size", 1)
+
+
+def job_key(model: str, job_type: str, gen_args: dict) -> Key:
+    return model, gen_args.get("sampler_name", "euler"), len(gen_args.get("lora") or ()), job_type
+
+
+class CostModel:
+    """Learns GPU seconds per megapixel-step from completed jobs.
+
+    Keeps an exponentially weighted rate per (model, sampler, LoRA count, job type)
+    plus a fixed per-pass overhead, falling back to the average over all keys (and
+    then `default_rate`) for combinations it has not seen yet.
+    """
+
+    def __init__(self, path: Optional[str] = None, default_rate: float = 0.15, overhead: float = 1.0, alpha: float = 0.2):
+        self.path = path
+        self.default_rate = default_rate
+        self.overhead = overhead
+        self.alpha = alpha
+        self._rates: Dict[Key, float] = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            try:
+                with open(path) as handle:
+                    stored = json.load(handle)
+                self._rates = {tuple(entry["key"]): entry["rate"] for entry in stored}
+            except (OSError, ValueError, KeyError, TypeError):
+                self._rates = {}
+
+    def rate(self, key: Key) -> float:
+        with self._lock:
+            if key in self._rates:
+                return self._rates[key]
+            if self._rates:
+                return sum(self._rates.values()) / len(self._rates)
+        return self.default_rate
+
+    def predict(self, key: Key, work: float) -> float:
+        return self.overhead + self.rate(key) * work
+
+    def observe(self, key: Key, work: float, seconds: float) -> None:
+        if work <= 0 or seconds <= 0:
+            return
+        sample = max(seconds - self.overhead, 0.0) / work
+        with self._lock:
+            previous = self._rates.get(key)
+            self._rates[key] = sample if previous is None else previous + self.alpha * (sample - previous)
+
+    def observe_batch(self, keys_and_work: Sequence[Tuple[Key, float]], seconds: float) -> None:
+        """Attribute one GPU pass that served several jobs (micro-batch) to its first job's key."""
+        total = sum(work for _, work in keys_and_work)
+        if keys_and_work:
+            self.observe(keys_and_work[0][0], total, seconds)
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        with self._lock:
+            stored = [{"key": list(key), "rate": rate} for key, rate in self._rates.items()]
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as handle:
+            json.dump(stored, handle)
+        os.replace(tmp_path, self.path)
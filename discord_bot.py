@@ -2,16 +2,30 @@
 import asyncio
 import re
 import time
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from typing import List, Optional
 
+# Baseline for the startup report; the imports below count towards "import".
+IMPORT_STARTED = time.perf_counter()
+
 import discord
-import httpx
 from discord import app_commands
-from PIL import Image
 
-from imagegen import generate_images, preprocess_gen_args, upscale_image, set_progress_bar_global_hook
-from prompt_processing import format_generation_summary, preprocess_prompt
+import engine
+import image_io
+import metrics
+import prompt_processing
+from caching import LRUCache
+from cost_model import CostModel, job_key, job_work
+from image_store import ImageStore
+from job_journal import JobJournal
+from llm_client import LLMClient
+from message_index import MessageIndex, MessageRecord
+from progress import ProgressReporter
+from scheduler import JobScheduler
+from workers import WorkerPool, connect_engines, spawn_workers
+from prompt_processing import format_generation_summary, preprocess_gen_args, preprocess_prompt
 import vars
 from vars import (
     CHANNEL_IDS,
@@ -25,6 +39,7 @@ from vars import (
     UPSCALE_HARD_EMOJI,
     UPSCALE_WEAK_EMOJI,
     NUMBER_EMOJIS,
+    UPSCALE_ALL_EMOJI,
     KEYWORDS,
     WILDCARDS,
     SAMPLERS,
@@ -37,15 +52,32 @@ from vars import (
 
 
 class ImageJob:
-    def __init__(self, source, gen_args, user_id, deferred=False, job_type="generate", base_image=None):
+    def __init__(self, source, gen_args, user_id, deferred=False, job_type="generate", base_images=None, base_latents=None):
         self.source = source
         self.gen_args = gen_args
         self.user_id = user_id
         self.deferred = deferred
         self.job_type = job_type
-        self.base_image = base_image
+        self.base_images = list(base_images or [])
+        self.base_latents = base_latents
+        # False while the prompt is still being enhanced; the scheduler skips the job until then.
+        self.ready = True
+        self.prompt_task = None
+        self.latents = []
         self.progress_message = None
+        self.progress_hook = None
+        self.progress_task = None
         self.last_progress_update = 0
+        self.enqueued_at = time.time()
+        self.timings = {}
+        self.journal_id = None
+
+
+class ReplaySource:
+    """Stands in for the original interaction of a job replayed from the journal."""
+
+    def __init__(self, channel):
+        self.channel = channel
 
 
 def build_progress_bar(current: int, total: int, bar_length: int = 10) -> str:
@@ -60,8 +92,64 @@ def build_progress_bar(current: int, total: int, bar_length: int = 10) -> str:
     return f"`{bar}` {current}/{total}"
 
 
-job_queue = asyncio.Queue()
+def estimate_cost(job: ImageJob) -> float:
+    """Rough GPU cost in megapixel-steps, used to weigh users against each other."""
+    if not job.base_images:
+        return job_work(job.job_type, job.gen_args)
+    return len(job.base_images) * job_work(job.job_type, job.gen_args, job.base_images[0].size)
+
+
+def job_priority(job: ImageJob) -> int:
+    """Lower runs first: upscales are cheap and someone is usually waiting on them."""
+    return 0 if job.job_type == "upscale" else 1
+
+
+job_queue = JobScheduler(
+    user_of=lambda job: job.user_id,
+    cost_of=estimate_cost,
+    priority_of=job_priority,
+    user_cap=vars.USER_MAX_IN_FLIGHT,
+    ready_of=lambda job: job.ready,
+)
 queue_worker_task = None
+metrics_task = None
+# Single thread so sampling jobs never overlap on the GPU.
+gpu_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gpu")
+# With WORKER_DEVICES or ENGINE_SOCKETS set, generation runs in engine processes instead of
+# gpu_executor, and the bot never imports ComfyUI or torch.
+worker_pool = WorkerPool(
+    spawn_workers(vars.WORKER_DEVICES, vars.WORKER_PRELOAD) + connect_engines(vars.ENGINE_SOCKETS),
+    health_interval=vars.WORKER_HEALTH_INTERVAL,
+    ping_timeout=vars.WORKER_PING_TIMEOUT,
+    max_attempts=vars.WORKER_MAX_ATTEMPTS,
+    affinity_slots=vars.LORA_CACHE_MAX_ENTRIES,
+) if vars.WORKER_DEVICES or vars.ENGINE_SOCKETS else None
+# Imported (and the model loaded) in the background by start_engine() for in-process generation.
+imagegen = None
+engine_ready = asyncio.Event()
+engine_task = None
+startup_timings = {}
+publish_tasks = set()
+journal = JobJournal(vars.JOURNAL_PATH) if vars.JOURNAL_PATH else None
+cost_model = CostModel(vars.COST_MODEL_PATH)
+message_index = MessageIndex(vars.MESSAGE_INDEX_PATH, vars.MESSAGE_INDEX_CACHE_SIZE)
+llm_client = LLMClient(
+    vars.LLM_API_URL,
+    OPENROUTER_API_KEY,
+    cache_path=vars.LLM_CACHE_PATH,
+    cache_size=vars.LLM_CACHE_SIZE,
+    max_concurrency=vars.LLM_MAX_CONCURRENCY,
+    max_retries=vars.LLM_MAX_RETRIES,
+    timeout=vars.LLM_TIMEOUT,
+)
+latent_cache = LRUCache(
+    vars.LATENT_CACHE_MAX_ENTRIES,
+    max_bytes=vars.LATENT_CACHE_BUDGET_MB * 1024 * 1024,
+    sizeof=lambda latent: len(latent[1]),
+)
+image_store = ImageStore(vars.IMAGE_STORE_DIR, vars.IMAGE_STORE_BUDGET_MB * 1024 * 1024, vars.IMAGE_STORE_HOT_ENTRIES)
+# Jobs taken from the queue but not yet through the GPU: job -> [predicted seconds, GPU start time].
+gpu_backlog = {}
 
 intents = discord.Intents.default()
 intents.message_content = True
@@ -70,12 +158,18 @@ client = discord.Client(intents=intents)
 tree = app_commands.CommandTree(client)
 
 
-def reload_vars():
-    """Reload the vars module to pick up changes."""
+async def reload_vars():
+    """Reload the vars module to pick up changes.
+
+    imagegen is reloaded on the GPU executor so it never swaps models under a running batch.
+    """
     import importlib
     importlib.reload(vars)
     global txt2img_args, upscale_weak_args, upscale_hard_args, LORA_CONFIG, KEYWORDS, SAMPLERS, SCHEDULERS, DIMENSION_PRESETS
     from vars import txt2img_args, upscale_weak_args, upscale_hard_args, LORA_CONFIG, KEYWORDS, SAMPLERS, SCHEDULERS, DIMENSION_PRESETS
+    prompt_processing.reload_config()
+    if imagegen is not None:
+        await asyncio.get_running_loop().run_in_executor(gpu_executor, imagegen.reload_config)
 
 
 ENHANCE_PROMPT_TEMPLATE = """你是一位被关在逻辑牢笼里的幻视艺术家。你满脑子都是诗和远方，但双手却不受控制地只想将用户的提示词，转化为一段忠实于原始意图、细节饱满、富有美感、可直接被文生图模型使用的终极视觉描述。任何一点模糊和比喻都会让你浑身难受。
@@ -90,38 +184,20 @@ ENHANCE_PROMPT_TEMPLATE = """你是一位被关在逻辑牢笼里的幻视艺术
 
 
 async def enhance_prompt_with_llm(prompt: str) -> str:
-    """Send prompt to OpenRouter qwen/qwen3-8b for enhancement."""
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                "Content-Type": "application/json",
-            },
-            json={
-                "model": "qwen/qwen3-8b",
-                "messages": [
-                    {"role": "user", "content": ENHANCE_PROMPT_TEMPLATE.format(prompt=prompt)}
-                ],
-                #"max_completion_tokens": 256,
-            },
-            timeout=30.0,
-        )
-        response.raise_for_status()
-        data = response.json()
-        llm_output:str = data["choices"][0]["message"]["content"].strip()
-        if len(llm_output) < 2048:
-            if llm_output.startswith('"') and llm_output.endswith('"'):
-                llm_output = llm_output[1:-1]
-            return llm_output
-        else: return prompt
+    """Send prompt to the configured chat-completions model (qwen/qwen3-8b on OpenRouter) for enhancement."""
+    llm_output = await llm_client.complete(vars.LLM_MODEL, ENHANCE_PROMPT_TEMPLATE, prompt)
+    if len(llm_output) < 2048:
+        if llm_output.startswith('"') and llm_output.endswith('"'):
+            llm_output = llm_output[1:-1]
+        return llm_output
+    else: return prompt
 
 
-def format_info(user, gen_args):
+def format_info(user, gen_args, image_count=1):
     if 'batch_size' in gen_args:
         img_c = " Generated image" if gen_args['batch_size'] == 1 else f" Generated {gen_args['batch_size']} images"
     else:
-        img_c = " Upscaled image"
+        img_c = " Upscaled image" if image_count == 1 else f" Upscaled {image_count} images"
 
     display_neg = gen_args.get('display_neg_prompt')
     if display_neg:
@@ -233,18 +309,67 @@ def extract_generation_details(content):
 
     return prompt, negative_prompt, parsed_params
 
+
+# Samplers whose only randomness is the initial noise. Every other sampler (ancestral, SDE,
+# sa_solver, seeds_*, ...) draws per-step noise from the first job's seed in a merged pass, so
+# its jobs could not be reproduced from their own seed.
+DETERMINISTIC_SAMPLERS = frozenset({
+    "euler", "heun", "heunpp2", "dpm_2", "lms", "dpmpp_2m", "ipndm", "ipndm_v", "deis",
+    "ddim", "uni_pc", "uni_pc_bh2", "res_multistep",
+})
+
+
+def batch_key(job: ImageJob):
+    """Jobs with equal keys can share one sampler pass; None means never merge."""
+    args = job.gen_args
+    if job.job_type != "generate" or (args.get("sampler_name") or "euler") not in DETERMINISTIC_SAMPLERS:
+        return None
+    return (
+        args.get("width"),
+        args.get("height"),
+        args.get("steps"),
+        args.get("cfg"),
+        args.get("sampler_name"),
+        args.get("scheduler"),
+        tuple(args.get("lora") or ()),
+        bool(args.get("noise", False)),
+    )
+
+
+async def collect_batch(first: ImageJob) -> List[ImageJob]:
+    """Gather queued jobs compatible with `first` for a short window, up to the max latent batch."""
+    batch = [first]
+    key = batch_key(first)
+    if key is None or vars.MICROBATCH_WINDOW <= 0:
+        return batch
+    total = first.gen_args.get("batch_size", 1)
+
+    def fits(job):
+        return batch_key(job) == key and total + job.gen_args.get("batch_size", 1) <= vars.MICROBATCH_MAX_BATCH
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + vars.MICROBATCH_WINDOW
+    while total < vars.MICROBATCH_MAX_BATCH:
+        job = job_queue.take_matching(fits)
+        if job is not None:
+            batch.append(job)
+            total += job.gen_args.get("batch_size", 1)
+            continue
+        remaining = deadline - loop.time()
+        if remaining <= 0 or not await job_queue.wait_for_change(remaining):
+            break
+    return batch
+
+
 async def queue_worker():
-    """Process queued jobs sequentially to avoid overlapping GPU workloads."""
-    while True:
-        job = await job_queue.get()
-        try:
-            await process_job(job)
-        except Exception as exc:  # noqa: BLE001
-            print(f"Error processing job: {exc}")
-        finally:
-            job_queue.task_done()
+    """Run the prepare -> GPU -> publish pipeline; only the GPU stage is exclusive (one lane per worker)."""
+    lanes = worker_pool.size if worker_pool is not None else 1
+    ready = asyncio.Queue(maxsize=vars.PIPELINE_DEPTH * lanes)
+    await asyncio.gather(prepare_stage(ready), *(gpu_stage(ready) for _ in range(lanes)))
 
-async def process_job(job: ImageJob):
+
+async def start_progress(job: ImageJob):
+    """Send the job's progress message and start animating it; returns (message, hook, task)."""
     if isinstance(job.source, discord.Interaction):
         # Ensure the interaction is deferred before we start the heavy work.
         if not job.deferred and not job.source.response.is_done():
@@ -258,200 +383,576 @@ async def process_job(job: ImageJob):
     # For interactions, send progress as followup (attached to "used /imagine")
     # For reactions, send progress as separate message
     total_steps = job.gen_args.get('steps', 20)
-    if isinstance(job.source, discord.Interaction):
+    if job.progress_message is not None:
+        # Keep the queue position/ETA up until the GPU pass reports its first step.
+        progress_msg = job.progress_message
+    elif isinstance(job.source, discord.Interaction):
         progress_msg = await send_callable(content="Starting.")
     else:
         progress_msg = await channel.send(content="Starting.")
     
-    progress_state = {"current": 0, "total": total_steps, "last_update": time.time(), "started": False, "dots": 1}
-    update_queue = asyncio.Queue()
+    reporter = ProgressReporter(
+        progress_msg,
+        asyncio.get_running_loop(),
+        total_steps,
+        lambda current, total: f"Generating... {build_progress_bar(current, total)}",
+    )
+    progress_task = asyncio.create_task(reporter.run())
+    return progress_msg, reporter.hook, progress_task
 
-    def progress_hook(current, total, preview, node_id=None):
-        progress_state["current"] = current
-        progress_state["total"] = total
-        progress_state["started"] = True
-        now = time.time()
-        # Only queue update if enough time has passed (rate limit friendly)
-        if now - progress_state["last_update"] >= 1.0:
-            progress_state["last_update"] = now
-            try:
-                update_queue.put_nowait((current, total))
-            except asyncio.QueueFull:
-                pass
-
-    async def update_progress():
-        while True:
-            try:
-                current, total = await asyncio.wait_for(update_queue.get(), timeout=0.5)
-                await progress_msg.edit(content=f"Generating... {build_progress_bar(current, total)}")
-            except asyncio.TimeoutError:
-                # Animate dots while waiting to start
-                if not progress_state["started"]:
-                    progress_state["dots"] = (progress_state["dots"] % 3) + 1
-                    dots = "." * progress_state["dots"]
-                    await progress_msg.edit(content=f"Starting{dots}")
-                continue
-            except asyncio.CancelledError:
-                break
 
-    # Start progress updater task
-    progress_task = asyncio.create_task(update_progress())
+async def stop_progress(progress_task):
+    progress_task.cancel()
+    try:
+        await progress_task
+    except asyncio.CancelledError:
+        pass
+
+
+async def prepare_batch(jobs: List[ImageJob]) -> List[ImageJob]:
+    """Prepare stage: defer interactions and post progress messages; returns the jobs that are ready.
+
+    A job whose progress message cannot be posted (deleted message, expired interaction) is
+    finished on its own so the rest of a merged batch still runs.
+    """
+    prepared = []
+    for job in jobs:
+        try:
+            metrics.record("queue_wait", time.time() - job.enqueued_at, job.timings)
+            gpu_backlog[job] = [predict_seconds(job), None]
+            job.progress_message, job.progress_hook, job.progress_task = await start_progress(job)
+        except Exception as exc:  # noqa: BLE001
+            print(f"Error preparing job: {exc}")
+            if job.progress_task is not None:
+                await stop_progress(job.progress_task)
+            mark_done([job])
+            continue
+        prepared.append(job)
+    return prepared
+
+
+def keeps_latents(jobs: List[ImageJob]) -> bool:
+    """Whether to cache a generation's latents: only when a job or upscale preset upscales in latent space."""
+    return any(job.gen_args.get("latent") for job in jobs) or any(
+        preset.get("latent") for preset in (upscale_weak_args, upscale_hard_args)
+    )
+
+
+async def run_batch(jobs: List[ImageJob]):
+    """GPU stage: sample and decode on the dedicated GPU thread (or an engine worker); returns one image list per job."""
+    hooks = [job.progress_hook for job in jobs]
+
+    def progress_hook(current, total, preview, node_id=None):
+        for hook in hooks:
+            hook(current, total, preview, node_id)
 
     loop = asyncio.get_running_loop()
-    set_progress_bar_global_hook(progress_hook)
     
-    try:
-        if job.job_type == "upscale":
-            def run_upscale():
-                return [upscale_image(job.base_image, job.gen_args)]
+    timings = {}
 
-            images = await loop.run_in_executor(None, run_upscale)
+    def run_gpu():
+        # Installing the hook may import ComfyUI, so it happens here on the GPU thread.
+        imagegen.set_progress_bar_global_hook(progress_hook)
+        try:
+            with metrics.collect(timings), metrics.span("gpu"):
+                if jobs[0].job_type == "upscale":
+                    latents = [None if latent is None else engine.unpack_tensor(latent) for latent in jobs[0].base_latents or []]
+                    return [imagegen.upscale_images(jobs[0].base_images, jobs[0].gen_args, latents or None)]
+                latents = [] if keeps_latents(jobs) else None
+                results = imagegen.generate_images_batch([job.gen_args for job in jobs], latents)
+                if latents is not None:
+                    offset = 0
+                    for job, images in zip(jobs, results):
+                        job.latents = [engine.pack_tensor(latent) for latent in latents[offset:offset + len(images)]]
+                        offset += len(images)
+                return results
+        finally:
+            imagegen.set_progress_bar_global_hook(None)
+
+    started = time.time()
+    for job in jobs:
+        gpu_backlog.setdefault(job, [predict_seconds(job), None])[1] = started
+        # One edit as the pass starts; after that the reporter only edits when a step completes.
+        job.progress_hook(0, job.gen_args.get('steps', 20), None)
+    try:
+        if worker_pool is not None:
+            results = await run_on_worker(jobs, progress_hook, timings)
         else:
-            images = await loop.run_in_executor(None, lambda: generate_images(job.gen_args))
+            results = await loop.run_in_executor(gpu_executor, run_gpu)
     finally:
-        set_progress_bar_global_hook(None)
-        progress_task.cancel()
+        for job in jobs:
+            gpu_backlog.pop(job, None)
+            job.timings.update(timings)
+            await stop_progress(job.progress_task)
+
+    cost_model.observe_batch(
+        [(job_cost_key(job), estimate_cost(job)) for job in jobs], timings.get("gpu", time.time() - started),
+    )
+    if cost_model.path:
+        await asyncio.to_thread(cost_model.save)
+    if "first_job_gpu" not in startup_timings:
+        startup_timings["first_job_gpu"] = timings.get("gpu", time.time() - started)
+        warmed = "after" if "warmup" in startup_timings else "without"
+        print(f"First job: {startup_timings['first_job_gpu']:.2f}s on the GPU ({warmed} warm-up)")
+    return results
+
+
+async def run_on_worker(jobs: List[ImageJob], progress_hook, timings):
+    """GPU stage on a worker process: same results as run_gpu, with images and latents sent as raw bytes."""
+    blobs = []
+    if jobs[0].job_type == "upscale":
+        job = jobs[0]
+        header = {
+            "op": "upscale",
+            "gen_args": job.gen_args,
+            "images": engine.pack_images(job.base_images, blobs),
+            "latents": engine.pack_latents(job.base_latents or [], blobs),
+        }
+    else:
+        header = {"op": "generate", "gen_args": [job.gen_args for job in jobs], "keep_latents": keeps_latents(jobs)}
+    response, out_blobs = await worker_pool.submit(
+        header,
+        blobs,
+        affinity=tuple(jobs[0].gen_args.get("lora") or ()),
+        progress=lambda current, total: progress_hook(current, total, None),
+    )
+    for stage, seconds in response.get("timings", {}).items():
+        metrics.record(stage, seconds, timings)
+    results = [await asyncio.to_thread(engine.unpack_images, metas, out_blobs) for metas in response["images"]]
+    for job, latent_metas in zip(jobs, response.get("latents", [])):
+        job.latents = engine.unpack_latents(latent_metas, out_blobs)
+    return results
+
+
+async def publish_batch(jobs: List[ImageJob], results):
+    """Encode and publish stage; runs concurrently with the next GPU pass."""
+    for job, images in zip(jobs, results):
         try:
-            await progress_task
-        except asyncio.CancelledError:
-            pass
-
-    files = []
-    for idx, image in enumerate(images, start=1):
-        buffer = BytesIO()
-        image.save(buffer, format="PNG")
-        buffer.seek(0)
-        files.append(discord.File(buffer, filename=f"generated_{idx}.png"))
-
-    content = format_info(job.user_id, job.gen_args)
-
-    # Edit the progress message with final content and files (avoids interaction token expiry issues)
-    await progress_msg.edit(content=content, attachments=files)
-    message = progress_msg
-
-    if job.job_type == "generate":
-        await message.add_reaction(REROLL_EMOJI)
-        batch_size = job.gen_args.get("batch_size", len(images))
-        if batch_size == 1:
-            await message.add_reaction(UPSCALE_WEAK_EMOJI)
-            await message.add_reaction(UPSCALE_HARD_EMOJI)
+            await publish_result(job, job.progress_message, images)
+        except Exception as exc:  # noqa: BLE001
+            print(f"Error publishing job: {exc}")
+
+
+def mark_done(jobs: List[ImageJob]):
+    for job in jobs:
+        gpu_backlog.pop(job, None)
+        if journal is not None and job.journal_id is not None:
+            journal.complete(job.journal_id)
+        job_queue.task_done(job)
+
+
+def job_cost_key(job: ImageJob):
+    return job_key(vars.MODEL_NAME, job.job_type, job.gen_args)
+
+
+def predict_seconds(job: ImageJob) -> float:
+    return cost_model.predict(job_cost_key(job), estimate_cost(job))
+
+
+def predict_wait(job: ImageJob) -> float:
+    """Predicted seconds until `job` would reach the GPU if queued now."""
+    now = time.time()
+    wait = 0.0
+    for predicted, started in gpu_backlog.values():
+        wait += max(0.0, predicted - (now - started)) if started else predicted
+    return wait + sum(predict_seconds(queued) for queued in job_queue.jobs_ahead_if_queued(job))
+
+
+def format_duration(seconds: float) -> str:
+    if seconds < 90:
+        return f"~{max(1, round(seconds))}s"
+    return f"~{round(seconds / 60)}m"
+
+
+async def enqueue_job(job: ImageJob) -> bool:
+    """Admit, journal (when enabled) and queue the job; False if it was rejected."""
+    wait = predict_wait(job)
+    note = ""
+    limit = vars.MAX_PREDICTED_WAIT
+    if limit and wait + predict_seconds(job) > limit:
+        if vars.ADMISSION_MODE == "downscale" and job.job_type == "generate" and job.gen_args.get("batch_size", 1) > 1:
+            job.gen_args["batch_size"] = 1
+            note = " Batch reduced to 1 because the queue is busy."
+        if wait + predict_seconds(job) > limit:
+            await reject_job(job, wait)
+            return False
+
+    if journal is not None:
+        if isinstance(job.source, discord.Interaction):
+            channel_id, message_id = job.source.channel_id, None
         else:
-            for idx in range(min(batch_size, len(NUMBER_EMOJIS))):
-                await message.add_reaction(NUMBER_EMOJIS[idx])
-        await message.add_reaction(DELETE_EMOJI)
+            channel_id, message_id = job.source.channel.id, getattr(job.source, "id", None)
+        base_images = [data for data, _ in await image_io.encode_images(job.base_images, mode="png")]
+        job.journal_id = await asyncio.to_thread(
+            journal.add, job.job_type, job.gen_args, job.user_id, channel_id, message_id, base_images,
+        )
+    if not job.ready:
+        note += " Enhancing prompt."
+    await announce_position(job, wait, note)
+    await job_queue.put(job)
+    return True
+
+
+async def enhance_job_prompt(job: ImageJob, prompt: str):
+    """Enhancement stage: rewrite a queued job's prompt, then let the scheduler run it.
+
+    Falls back to the original prompt if the LLM fails or takes longer than
+    LLM_ENHANCE_TIMEOUT.
+    """
+    try:
+        with metrics.span("enhance", job.timings):
+            enhanced = await asyncio.wait_for(enhance_prompt_with_llm(prompt), vars.LLM_ENHANCE_TIMEOUT)
+        job.gen_args["prompt"] = enhanced
+        job.gen_args["display_prompt"] = enhanced
+        if journal is not None and job.journal_id is not None:
+            await asyncio.to_thread(journal.update, job.journal_id, job.gen_args)
+    except Exception as exc:  # noqa: BLE001
+        print(f"Prompt enhancement failed, using the original prompt: {exc!r}")
+    finally:
+        job.ready = True
+        job_queue.ready_changed()
+
+
+async def reject_job(job: ImageJob, wait: float):
+    content = f"<@{job.user_id}> The queue is full (about {format_duration(wait)} of work ahead). Please try again later."
+    if isinstance(job.source, discord.Interaction):
+        await job.source.followup.send(content=content)
     else:
-        await message.add_reaction(DELETE_EMOJI)
+        await job.source.channel.send(content=content, delete_after=30)
+
+
+async def announce_position(job: ImageJob, wait: float, note: str = ""):
+    """Post the job's progress message up front with its queue position and ETA."""
+    position = len(job_queue.jobs_ahead_if_queued(job)) + 1
+    finish = wait + predict_seconds(job)
+    content = f"Queued, position {position}. Starts in {format_duration(wait)}, done in {format_duration(finish)}.{note}"
+    if isinstance(job.source, discord.Interaction):
+        job.progress_message = await job.source.followup.send(content=content, wait=True)
+    else:
+        job.progress_message = await job.source.channel.send(content=content)
+
+
+async def replay_journal():
+    """Re-queue jobs left over from a previous run."""
+    entries = await asyncio.to_thread(journal.replay, vars.JOURNAL_MAX_ATTEMPTS)
+    if not entries:
+        await asyncio.to_thread(journal.compact)
+        return
+    print(f"Replaying {len(entries)} journaled job(s)")
+    for entry in entries:
+        try:
+            channel = client.get_channel(entry.channel_id) or await client.fetch_channel(entry.channel_id)
+        except discord.HTTPException:
+            journal.complete(entry.id)
+            continue
+        if entry.message_id:
+            source = channel.get_partial_message(entry.message_id)
+        else:
+            source = ReplaySource(channel)
+        if entry.job_type == "upscale" and not entry.base_images:
+            journal.complete(entry.id)
+            continue
+        base_images = [await image_io.decode_image_async(data) for data in entry.base_images]
+        job = ImageJob(source, entry.gen_args, entry.user_id, job_type=entry.job_type, base_images=base_images)
+        job.journal_id = entry.id
+        await job_queue.put(job)
+
+
+async def prepare_stage(ready: asyncio.Queue):
+    while True:
+        batch = await prepare_batch(await collect_batch(await job_queue.get()))
+        if batch:
+            await ready.put(batch)
+
+
+async def gpu_stage(ready: asyncio.Queue):
+    publishing = asyncio.Semaphore(vars.PIPELINE_MAX_PUBLISHING)
+    # Jobs queue and get prepared while the engine is still warming up.
+    await engine_ready.wait()
+    while True:
+        batch = await ready.get()
+        try:
+            results = await run_batch(batch)
+        except Exception as exc:  # noqa: BLE001
+            print(f"Error processing job: {exc}")
+            mark_done(batch)
+            continue
+
+        await publishing.acquire()
+        task = asyncio.create_task(publish_batch(batch, results))
+        publish_tasks.add(task)
+
+        def on_published(finished, batch=batch):
+            publish_tasks.discard(finished)
+            publishing.release()
+            mark_done(batch)
+
+        task.add_done_callback(on_published)
+
+
+async def publish_result(job: ImageJob, progress_msg, images):
+    with metrics.span("encode", job.timings):
+        encoded = await image_io.encode_images(images)
+    files = [
+        discord.File(BytesIO(data), filename=f"generated_{idx}.{extension}")
+        for idx, (data, extension) in enumerate(encoded, start=1)
+    ]
+
+    content = format_info(job.user_id, job.gen_args, len(images))
+
+    with metrics.span("upload", job.timings):
+        # Edit the progress message with final content and files (avoids interaction token expiry issues)
+        edited = await progress_msg.edit(content=content, attachments=files)
+        message = progress_msg
+        # The local copy is written once the upload is out of the way, on the same bounded pool.
+        digests = await image_io.store_images(image_store, images)
+
+        attachments = getattr(edited or progress_msg, "attachments", None) or []
+        record = MessageRecord(
+            message.id,
+            message.channel.id,
+            job.user_id,
+            job.job_type,
+            job.gen_args,
+            image_refs=[getattr(attachment, "url", "") for attachment in attachments],
+            image_digests=digests,
+        )
+        await asyncio.to_thread(message_index.add, record)
+        for index, latent in enumerate(job.latents):
+            latent_cache.put((message.id, index), latent)
+        job.latents = []
+
+        if job.job_type == "generate":
+            await message.add_reaction(REROLL_EMOJI)
+            batch_size = job.gen_args.get("batch_size", len(images))
+            if batch_size == 1:
+                await message.add_reaction(UPSCALE_WEAK_EMOJI)
+                await message.add_reaction(UPSCALE_HARD_EMOJI)
+            else:
+                for idx in range(min(batch_size, len(NUMBER_EMOJIS))):
+                    await message.add_reaction(NUMBER_EMOJIS[idx])
+                await message.add_reaction(UPSCALE_ALL_EMOJI)
+            await message.add_reaction(DELETE_EMOJI)
+        else:
+            await message.add_reaction(DELETE_EMOJI)
+
+    metrics.record("total", time.time() - job.enqueued_at, job.timings)
+    metrics.job_completed(job.timings)
+
+
+def metrics_gauges():
+    gauges = {
+        "queue_depth": job_queue.qsize(),
+        "jobs_per_minute": metrics.throughput(),
+    }
+    if imagegen is not None:
+        conditioning = imagegen.conditioning_cache_stats()
+        gauges["conditioning_cache_hits"] = conditioning["hits"]
+        gauges["conditioning_cache_misses"] = conditioning["misses"]
+    if worker_pool is not None:
+        gauges.update({f"worker_{name}": value for name, value in worker_pool.stats().items()})
+    return gauges
+
+
+def mark_startup(stage: str):
+    if stage not in startup_timings:
+        startup_timings[stage] = time.perf_counter() - IMPORT_STARTED
+
+
+def report_startup():
+    """Print one startup line once the commands are synced and the engine is up."""
+    if "commands_synced" not in startup_timings or "engine_ready" not in startup_timings:
+        return
+    milestones = ("import", "connected", "commands_synced", "engine_ready")
+    line = ", ".join(f"{stage} {startup_timings[stage]:.2f}s" for stage in milestones if stage in startup_timings)
+    stages = ", ".join(
+        f"{stage} {seconds:.2f}s" for stage, seconds in startup_timings.items() if stage not in milestones
+    )
+    print(f"Startup: {line}" + (f" (engine: {stages})" if stages else ""))
+
+
+def load_imagegen():
+    """Import imagegen (torch, then ComfyUI) and load the base model; runs on the GPU thread."""
+    global imagegen
+    started = time.perf_counter()
+    import imagegen as module
+    timings = {"imagegen_import": time.perf_counter() - started}
+    imagegen = module
+    timings.update(imagegen.warm_up())
+    return timings
+
+
+async def start_engine():
+    """Bring up the generation engine in the background; the GPU stage waits for engine_ready."""
+    try:
+        if worker_pool is not None:
+            await worker_pool.start()
+            for response in await worker_pool.broadcast({"op": "warm"}):
+                if not response.get("ok"):
+                    print(f"Engine warm-up failed: {response.get('error')}")
+                for stage, seconds in response.get("timings", {}).items():
+                    startup_timings[stage] = max(startup_timings.get(stage, 0.0), seconds)
+        else:
+            loop = asyncio.get_running_loop()
+            startup_timings.update(await loop.run_in_executor(gpu_executor, load_imagegen))
+    except Exception as exc:  # noqa: BLE001
+        # Jobs still run (and report their own errors) rather than waiting forever.
+        print(f"Engine warm-up failed: {exc}")
+    finally:
+        mark_startup("engine_ready")
+        engine_ready.set()
+    report_startup()
+
 
 @client.event
 async def on_ready():
-    global queue_worker_task  # noqa: PLW0603
+    global queue_worker_task, metrics_task, engine_task  # noqa: PLW0603
     print(f"Logged in as {client.user}")
+    mark_startup("connected")
+    if engine_task is None:
+        engine_task = client.loop.create_task(start_engine())
     if queue_worker_task is None:
         queue_worker_task = client.loop.create_task(queue_worker())
+        await asyncio.to_thread(message_index.prune, vars.MESSAGE_INDEX_MAX_AGE_DAYS)
+        if journal is not None:
+            await replay_journal()
+    if metrics_task is None and (vars.METRICS_FILE or vars.METRICS_PORT):
+        metrics_task = client.loop.create_task(metrics.run_exporter(metrics_gauges))
     await tree.sync()
+    mark_startup("commands_synced")
+    report_startup()
+
+REACTION_EMOJIS = {
+    REROLL_EMOJI, DELETE_EMOJI, UPSCALE_WEAK_EMOJI, UPSCALE_HARD_EMOJI, UPSCALE_ALL_EMOJI, *NUMBER_EMOJIS,
+}
+# Generation arguments an upscale inherits from the message it was requested on.
+UPSCALE_INHERITED = ("prompt", "neg_prompt", "display_prompt", "display_neg_prompt", "lora")
+
+
+async def legacy_record(channel, message_id: int) -> Optional[MessageRecord]:
+    """Rebuild a record by parsing a bot message posted before the index existed."""
+    message = await channel.fetch_message(message_id)
+    if message.author.id != client.user.id:
+        return None
+    details = extract_generation_details(message.content)
+    if details is None:
+        return None
+    prompt, negative_prompt, parsed_params = details
+    gen_args = preprocess_prompt(prompt, negative_prompt, parsed_params.get("lora"))
+    gen_args.update(parsed_params)
+    record = MessageRecord(
+        message.id,
+        channel.id,
+        0,
+        "generate",
+        gen_args,
+        image_refs=[attachment.url for attachment in message.attachments],
+        # Reactions already used by someone other than the bot (count includes the bot and this user).
+        triggered=[str(reaction.emoji) for reaction in message.reactions if reaction.count > 2],
+    )
+    await asyncio.to_thread(message_index.add, record)
+    return record
+
+
+async def load_record_image(channel, record: MessageRecord, index: int):
+    """Image `index` of an indexed message, from the local store or else downloaded."""
+    if index < len(record.image_digests):
+        image = await asyncio.to_thread(image_store.get, record.image_digests[index])
+        if image is not None:
+            return image
+    try:
+        data = await client.http.get_from_cdn(record.image_refs[index])
+    except discord.HTTPException:
+        # Signed CDN links expire; fall back to the live attachment.
+        message = await channel.fetch_message(record.message_id)
+        if index >= len(message.attachments):
+            return None
+        data = await message.attachments[index].read()
+    return await image_io.decode_image_async(data)
+
 
 @client.event
 async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
     if payload.user_id == client.user.id:
         return
 
+    emoji = str(payload.emoji)
+    if emoji not in REACTION_EMOJIS:
+        return
+    # Reactions on other people's messages are dropped without any API call.
+    author_id = getattr(payload, "message_author_id", None)
+    if author_id is not None and author_id != client.user.id:
+        return
+
     channel = client.get_channel(payload.channel_id)
     if channel is None:
         channel = await client.fetch_channel(payload.channel_id)
 
-    message = await channel.fetch_message(payload.message_id)
-    if message.author.id != client.user.id:
-        return
+    record = await asyncio.to_thread(message_index.get, payload.message_id)
 
-    emoji = str(payload.emoji)
     if emoji == DELETE_EMOJI:
-        await message.delete()
+        if record is None and author_id is None:
+            message = await channel.fetch_message(payload.message_id)
+            if message.author.id != client.user.id:
+                return
+        await channel.get_partial_message(payload.message_id).delete()
+        await asyncio.to_thread(message_index.remove, payload.message_id)
         return
 
-    details = extract_generation_details(message.content)
-    if details is None:
+    if record is None:
+        record = await legacy_record(channel, payload.message_id)
+        if record is None:
+            return
+    if record.job_type != "generate":
         return
-    prompt, negative_prompt, parsed_params = details
-    lora_names = parsed_params.get("lora")
-    processed_gen_args = preprocess_prompt(prompt, negative_prompt, lora_names)
+    source = channel.get_partial_message(payload.message_id)
 
     if emoji == REROLL_EMOJI:
-        if "width" not in parsed_params or "height" not in parsed_params:
+        if "width" not in record.gen_args or "height" not in record.gen_args:
             return
 
-        gen_args = dict(processed_gen_args)
-        gen_args.update(parsed_params)
+        gen_args = dict(record.gen_args)
         gen_args.pop("seed", None)
-        gen_args = preprocess_gen_args(dict(gen_args), txt2img_args)
+        gen_args = preprocess_gen_args(gen_args, txt2img_args)
 
-        await job_queue.put(ImageJob(message, gen_args, payload.user_id))
+        await enqueue_job(ImageJob(source, gen_args, payload.user_id))
         return
 
-    if emoji in NUMBER_EMOJIS:
-        if not message.attachments:
-            return
-
-        # Prevent double upscaling by checking reaction count
-        for reaction in message.reactions:
-            if str(reaction.emoji) == emoji and reaction.count > 2:
-                return
-
-        index = NUMBER_EMOJIS.index(emoji)
-        if index >= len(message.attachments):
-            return
-
-        attachment = message.attachments[index]
-        image_bytes = await attachment.read()
-        with Image.open(BytesIO(image_bytes)) as img:
-            base_image = img.convert("RGB").copy()
-
-        upscale_args = dict(processed_gen_args)
-        if "lora" in parsed_params:
-            lora_value = parsed_params["lora"]
-            upscale_args["lora"] = lora_value if isinstance(lora_value, list) else [lora_value]
-
-        await job_queue.put(
-            ImageJob(
-                message,
-                preprocess_gen_args(upscale_args, upscale_weak_args),
-                payload.user_id,
-                job_type="upscale",
-                base_image=base_image,
-            ),
-        )
+    image_count = max(len(record.image_refs), len(record.image_digests))
+    if emoji == UPSCALE_ALL_EMOJI:
+        indices = list(range(image_count))
+        preset = upscale_weak_args
+    elif emoji in NUMBER_EMOJIS:
+        indices = [NUMBER_EMOJIS.index(emoji)]
+        preset = upscale_weak_args
+    else:
+        indices = [0]
+        preset = upscale_weak_args if emoji == UPSCALE_WEAK_EMOJI else upscale_hard_args
+    if not indices or indices[-1] >= image_count:
         return
 
-    if emoji in {UPSCALE_WEAK_EMOJI, UPSCALE_HARD_EMOJI}:
-        if not message.attachments:
-            return
+    # Prevent double upscaling: each upscale emoji starts at most one job per message
+    if not await asyncio.to_thread(message_index.mark_triggered, record, emoji):
+        return
 
-        # Prevent double upscaling by checking reaction count
-        for reaction in message.reactions:
-            if str(reaction.emoji) == emoji and reaction.count > 2:
-                return
+    base_images = [await load_record_image(channel, record, index) for index in indices]
+    if any(image is None for image in base_images):
+        return
+    base_latents = None
+    if preset.get("latent"):
+        base_latents = [latent_cache.get((record.message_id, index)) for index in indices]
 
-        attachment = message.attachments[0]
-        image_bytes = await attachment.read()
-        with Image.open(BytesIO(image_bytes)) as img:
-            base_image = img.convert("RGB").copy()
-
-        upscale_args = dict(processed_gen_args)
-        if "lora" in parsed_params:
-            lora_value = parsed_params["lora"]
-            upscale_args["lora"] = lora_value if isinstance(lora_value, list) else [lora_value]
-
-        await job_queue.put(
-            ImageJob(
-                message,
-                preprocess_gen_args(
-                    upscale_args,
-                    upscale_weak_args if emoji == UPSCALE_WEAK_EMOJI else upscale_hard_args,
-                ),
-                payload.user_id,
-                job_type="upscale",
-                base_image=base_image,
-            ),
-        )
+    upscale_args = {key: record.gen_args[key] for key in UPSCALE_INHERITED if key in record.gen_args}
+    await enqueue_job(
+        ImageJob(
+            source,
+            preprocess_gen_args(upscale_args, preset),
+            payload.user_id,
+            job_type="upscale",
+            base_images=base_images,
+            base_latents=base_latents,
+        ),
+    )
 
 
 @tree.command(name="info", description="Show bot capabilities and presets")
@@ -461,11 +962,11 @@ async def info(interaction: discord.Interaction):
 
     if MODEL_NAME == "z_image":
         message = (
-            f"**Upscaling:** {UPSCALE_WEAK_EMOJI} weak / {UPSCALE_HARD_EMOJI} hard\n\n"
+            f"**Upscaling:** {UPSCALE_WEAK_EMOJI} weak / {UPSCALE_HARD_EMOJI} hard, {UPSCALE_ALL_EMOJI} all images of a batch\n\n"
             f"**Dimensions:** {dimension_list}\n\n"
             f"**Options:** `enhance_prompt` (LLM rewrite), `noise` (timestep range)\n\n"
             f"**Keywords:** wrap in `{{keyword}}`. Available: {keyword_list}.\n\n"
-            f"**Commands:** `/imagine`, `/upscale`, `/update`, `/info`"
+            f"**Commands:** `/imagine`, `/upscale`, `/update`, `/stats`, `/info`"
         )
     else:
         lora_list = ", ".join(f"`{name}`" for name in LORA_CONFIG.keys()) or "None"
@@ -473,14 +974,14 @@ async def info(interaction: discord.Interaction):
         sampler_list = ", ".join(f"`{s}`" for s in SAMPLERS)
         scheduler_list = ", ".join(f"`{s}`" for s in SCHEDULERS)
         message = (
-            f"**Upscaling:** {UPSCALE_WEAK_EMOJI} weak / {UPSCALE_HARD_EMOJI} hard\n\n"
+            f"**Upscaling:** {UPSCALE_WEAK_EMOJI} weak / {UPSCALE_HARD_EMOJI} hard, {UPSCALE_ALL_EMOJI} all images of a batch\n\n"
             f"**Dimensions:** {dimension_list}\n"
             f"**Samplers:** {sampler_list}\n"
             f"**Schedulers:** {scheduler_list}\n\n"
             f"**Keywords:** wrap in `{{keyword}}`. Available: {keyword_list}.\n"
             f"**Wildcards:** wrap in `{{wildcard}}`. Available: {wildcard_list}.\n"
             f"**LoRAs:** {lora_list}.\n\n"
-            f"**Commands:** `/imagine`, `/upscale`, `/update`, `/info`"
+            f"**Commands:** `/imagine`, `/upscale`, `/update`, `/stats`, `/info`"
         )
     await interaction.response.send_message(message, ephemeral=True)
 
@@ -547,11 +1048,6 @@ if MODEL_NAME == "z_image":
         processed_gen_args = preprocess_prompt(prompt, None, lora_names)
         final_prompt = processed_gen_args.get("display_prompt", prompt)
 
-        if enhance_prompt:
-            final_prompt = await enhance_prompt_with_llm(final_prompt)
-            processed_gen_args["prompt"] = final_prompt
-            processed_gen_args["display_prompt"] = final_prompt
-
         width, height = parse_dimensions(dimensions)
 
         base_args = {
@@ -563,9 +1059,7 @@ if MODEL_NAME == "z_image":
             "noise": noise,
         }
 
-        if enhance_prompt:
-            base_args["display_prompt"] = final_prompt
-        elif "display_prompt" in processed_gen_args:
+        if "display_prompt" in processed_gen_args:
             base_args["display_prompt"] = processed_gen_args["display_prompt"]
 
         if seed is not None:
@@ -576,7 +1070,12 @@ if MODEL_NAME == "z_image":
 
         gen_args = preprocess_gen_args(dict(base_args), txt2img_args)
 
-        await job_queue.put(ImageJob(interaction, gen_args, interaction.user.id, deferred=True))
+        job = ImageJob(interaction, gen_args, interaction.user.id, deferred=True)
+        if enhance_prompt:
+            # Queue right away; the job becomes schedulable once the LLM answers (or times out).
+            job.ready = False
+        if await enqueue_job(job) and enhance_prompt:
+            job.prompt_task = asyncio.create_task(enhance_job_prompt(job, final_prompt))
 
 else:
     @tree.command(name="imagine", description="Generate an image")
@@ -650,13 +1149,14 @@ else:
         gen_args = preprocess_gen_args(dict(base_args), txt2img_args)
 
         await interaction.response.defer(thinking=True)
-        await job_queue.put(ImageJob(interaction, gen_args, interaction.user.id, deferred=True))
+        await enqueue_job(ImageJob(interaction, gen_args, interaction.user.id, deferred=True))
 
 
 @tree.command(name="upscale", description="Upscale an image")
 @app_commands.describe(
     image="Image to upscale",
     mode="Upscale mode (weak: subtle touch-up, hard: creative rework)",
+    tiled="Sample in overlapping tiles (bounded VRAM for large images)",
 )
 @app_commands.choices(
     mode=[
@@ -668,6 +1168,7 @@ async def upscale(
     interaction: discord.Interaction,
     image: discord.Attachment,
     mode: str = "weak",
+    tiled: bool = False,
 ):
     if CHANNEL_IDS and interaction.channel_id not in CHANNEL_IDS:
         await interaction.response.send_message(
@@ -680,31 +1181,60 @@ async def upscale(
         await interaction.response.send_message("Please provide a valid image.", ephemeral=True)
         return
 
+    await interaction.response.defer(thinking=True)
     image_bytes = await image.read()
-    with Image.open(BytesIO(image_bytes)) as img:
-        base_image = img.convert("RGB").copy()
+    base_image = await image_io.decode_image_async(image_bytes)
 
     upscale_preset = upscale_weak_args if mode == "weak" else upscale_hard_args
     upscale_args = preprocess_gen_args({"prompt": "high quality, highres", "neg_prompt": ""}, upscale_preset)
+    if tiled:
+        upscale_args["tiled"] = True
 
-    await interaction.response.defer(thinking=True)
-    await job_queue.put(
+    await enqueue_job(
         ImageJob(
             interaction,
             upscale_args,
             interaction.user.id,
             deferred=True,
             job_type="upscale",
-            base_image=base_image,
+            base_images=[base_image],
         ),
     )
 
 
+@tree.command(name="stats", description="Show queue depth, throughput and stage timings")
+async def stats(interaction: discord.Interaction):
+    gauges = metrics_gauges()
+    lines = [
+        f"**Queue:** {gauges['queue_depth']} waiting",
+        f"**Throughput:** {metrics.throughput(300):.1f} jobs/min (5m), {metrics.throughput(3600):.1f} jobs/min (1h)",
+    ]
+    if "conditioning_cache_hits" in gauges:
+        lines.append(f"**Text cache:** {gauges['conditioning_cache_hits']} hits / {gauges['conditioning_cache_misses']} misses")
+    if worker_pool is not None:
+        lines.append(f"**Engines:** {gauges['worker_alive']}/{gauges['worker_workers']} up, {gauges['worker_busy']} busy")
+    percentiles = metrics.stage_percentiles()
+    if percentiles:
+        lines.append("```")
+        lines.append(f"{'stage':<12} {'n':>5} {'p50':>7} {'p95':>7} {'p99':>7}")
+        for stage, values in sorted(percentiles.items()):
+            lines.append(
+                f"{stage:<12} {values['count']:>5} {values['p50']:>6.2f}s {values['p95']:>6.2f}s {values['p99']:>6.2f}s"
+            )
+        lines.append("```")
+    await interaction.response.send_message("\n".join(lines), ephemeral=True)
+
+
 @tree.command(name="update", description="Reload vars.py configuration")
 async def update(interaction: discord.Interaction):
-    reload_vars()
-    await interaction.response.send_message("Configuration reloaded from vars.py", ephemeral=True)
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    await reload_vars()
+    if worker_pool is not None:
+        await worker_pool.broadcast({"op": "reload"})
+    await interaction.followup.send("Configuration reloaded from vars.py", ephemeral=True)
+
 
+mark_startup("import")
 
 if __name__ == "__main__":
     client.run(DISCORD_TOKEN)
\ No newline at end of file
@@ -0,0 +1,259 @@
+"""Generation requests as plain data, shared by worker processes and the engine server.
+
+A frame is a 4-byte big-endian length, a UTF-8 JSON header, then the raw blobs whose
+sizes the header lists under "blob_sizes". Images travel as raw pixel bytes with
+{"mode", "size", "blob"} metadata and latents as raw tensor bytes with
+{"dtype", "shape", "blob"}; "blob" indexes the frame's blob list.
+
+Requests: {"op": "generate", "gen_args": [...], "keep_latents": bool}, {"op": "upscale", "gen_args": {...},
+"images": [...], "latents": [...]}, {"op": "ping"}, {"op": "reload"} and {"op": "warm"}
+(import ComfyUI and load the model ahead of the first job). While a request
+runs the engine may send {"op": "progress", "current", "total"} frames before the
+response, which carries "ok" plus "images"/"latents" (one list per job; latents only
+when "keep_latents" was set) and "timings", or "error".
+
+Run as a worker speaking frames over stdin/stdout, or as a standalone engine server
+on a Unix socket that the bot connects to (ENGINE_SOCKETS in vars.py):
+
+    python engine.py --stdio [--preload module:function]
+    python engine.py --socket /run/imagegen/engine.sock
+"""
+import argparse
+import importlib
+import json
+import os
+import socketserver
+import struct
+import sys
+import threading
+import traceback
+from typing import BinaryIO, Callable, Dict, List, Optional, Sequence, Tuple
+
+from PIL import Image
+
+Frame = Tuple[dict, List[bytes]]
+PackedTensor = Tuple[dict, bytes]
+
+_LENGTH = struct.Struct(">I")
+
+
+def encode_frame(header: dict, blobs: Sequence[bytes] = ()) -> List[bytes]:
+    header = dict(header, blob_sizes=[len(blob) for blob in blobs])
+    encoded = json.dumps(header, separators=(",", ":")).encode()
+    return [_LENGTH.pack(len(encoded)), encoded, *blobs]
+
+
+def write_frame(stream: BinaryIO, header: dict, blobs: Sequence[bytes] = ()) -> None:
+    for part in encode_frame(header, blobs):
+        stream.write(part)
+    stream.flush()
+
+
+def _read_exactly(stream: BinaryIO, size: int) -> bytes:
+    data = stream.read(size)
+    if len(data) != size:
+        raise EOFError("engine stream closed")
+    return data
+
+
+def read_frame(stream: BinaryIO) -> Frame:
+    (length,) = _LENGTH.unpack(_read_exactly(stream, _LENGTH.size))
+    header = json.loads(_read_exactly(stream, length))
+    return header, [_read_exactly(stream, size) for size in header.pop("blob_sizes", [])]
+
+
+async def read_frame_async(reader) -> Frame:
+    """read_frame for an asyncio.StreamReader; raises asyncio.IncompleteReadError on EOF."""
+    (length,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+    header = json.loads(await reader.readexactly(length))
+    return header, [await reader.readexactly(size) for size in header.pop("blob_sizes", [])]
+
+
+def pack_images(images: Sequence[Image.Image], blobs: List[bytes]) -> List[dict]:
+    metas = []
+    for image in images:
+        metas.append({"mode": image.mode, "size": list(image.size), "blob": len(blobs)})
+        blobs.append(image.tobytes())
+    return metas
+
+
+def unpack_images(metas: Sequence[dict], blobs: Sequence[bytes]) -> List[Image.Image]:
+    return [Image.frombytes(meta["mode"], tuple(meta["size"]), blobs[meta["blob"]]) for meta in metas]
+
+
+def pack_tensor(tensor) -> PackedTensor:
+    """CPU bytes of a tensor; bfloat16 is widened since numpy has no such dtype."""
+    import torch
+
+    tensor = tensor.detach().to("cpu")
+    if tensor.dtype == torch.bfloat16:
+        tensor = tensor.float()
+    array = tensor.contiguous().numpy()
+    return {"dtype": array.dtype.str, "shape": list(array.shape)}, array.tobytes()
+
+
+def unpack_tensor(packed: PackedTensor):
+    import numpy as np
+    import torch
+
+    meta, data = packed
+    return torch.from_numpy(np.frombuffer(data, dtype=meta["dtype"]).reshape(meta["shape"]).copy())
+
+
+def pack_latents(latents: Sequence[Optional[PackedTensor]], blobs: List[bytes]) -> List[Optional[dict]]:
+    metas = []
+    for latent in latents:
+        if latent is None:
+            metas.append(None)
+            continue
+        meta, data = latent
+        metas.append(dict(meta, blob=len(blobs)))
+        blobs.append(data)
+    return metas
+
+
+def unpack_latents(metas: Sequence[Optional[dict]], blobs: Sequence[bytes]) -> List[Optional[PackedTensor]]:
+    return [None if meta is None else (meta, blobs[meta["blob"]]) for meta in metas]
+
+
+def handle_request(
+    header: dict, blobs: Sequence[bytes], progress: Optional[Callable[[int, int], None]] = None,
+) -> Frame:
+    """Run one request against this process's imagegen and return the response frame."""
+    import imagegen
+    import metrics
+    import vars
+
+    op = header.get("op")
+    if op == "ping":
+        return {"ok": True, "pid": os.getpid(), "model": vars.MODEL_NAME}, []
+    if op == "reload":
+        importlib.reload(vars)
+        imagegen.reload_config()
+        return {"ok": True}, []
+    if op == "warm":
+        try:
+            return {"ok": True, "timings": imagegen.warm_up()}, []
+        except Exception as exc:  # noqa: BLE001
+            traceback.print_exc()
+            return {"ok": False, "error": repr(exc)}, []
+
+    timings: Dict[str, float] = {}
+    out_blobs: List[bytes] = []
+    if progress is not None:
+        imagegen.set_progress_bar_global_hook(lambda current, total, preview, node_id=None: progress(current, total))
+    try:
+        with metrics.collect(timings), metrics.span("gpu"):
+            if op == "generate":
+                latents = [] if header.get("keep_latents") else None
+                results = imagegen.generate_images_batch(header["gen_args"], latents)
+                packed = [pack_tensor(latent) for latent in latents or []]
+                latent_metas, offset = [], 0
+                for images in results:
+                    latent_metas.append(pack_latents(packed[offset:offset + len(images)], out_blobs))
+                    offset += len(images)
+            elif op == "upscale":
+                images = unpack_images(header["images"], blobs)
+                latents = [
+                    None if latent is None else unpack_tensor(latent)
+                    for latent in unpack_latents(header.get("latents") or [], blobs)
+                ]
+                results = [imagegen.upscale_images(images, header["gen_args"], latents or None)]
+                latent_metas = [[]]
+            else:
+                return {"ok": False, "error": f"unknown op {op!r}"}, []
+        image_metas = [pack_images(images, out_blobs) for images in results]
+    except Exception as exc:  # noqa: BLE001
+        traceback.print_exc()
+        return {"ok": False, "error": repr(exc)}, []
+    finally:
+        if progress is not None:
+            imagegen.set_progress_bar_global_hook(None)
+    return {"ok": True, "images": image_metas, "latents": latent_metas, "timings": timings}, out_blobs
+
+
+def serve_stdio() -> None:
+    """Worker loop: one request frame in on stdin, progress frames and one response frame out on stdout."""
+    # ComfyUI and imagegen print to stdout; keep the real stdout for frames only.
+    frames_out = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    frames_in = sys.stdin.buffer
+    while True:
+        try:
+            header, blobs = read_frame(frames_in)
+        except EOFError:
+            return
+
+        def progress(current, total):
+            write_frame(frames_out, {"op": "progress", "current": current, "total": total})
+
+        response, out_blobs = handle_request(header, blobs, progress)
+        write_frame(frames_out, response, out_blobs)
+
+
+class _EngineHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                header, blobs = read_frame(self.rfile)
+            except (EOFError, ConnectionError):
+                return
+
+            def progress(current, total):
+                write_frame(self.wfile, {"op": "progress", "current": current, "total": total})
+
+            if header.get("op") == "ping":
+                response, out_blobs = handle_request(header, blobs)
+            else:
+                # One generation at a time per engine, whichever connection it came from.
+                with self.server.gpu_lock:
+                    response, out_blobs = handle_request(header, blobs, progress)
+            write_frame(self.wfile, response, out_blobs)
+
+
+class EngineServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str):
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, _EngineHandler)
+        self.gpu_lock = threading.Lock()
+
+
+def serve_socket(path: str) -> None:
+    """Engine server: each connection sends request frames and reads progress/response frames back."""
+    with EngineServer(path) as server:
+        print(f"Engine listening on {path}")
+
+        def warm():
+            # Accept connections right away; requests queue on the lock until the model is loaded.
+            with server.gpu_lock:
+                print(f"Engine warm: {handle_request({'op': 'warm'}, [])[0]}")
+
+        threading.Thread(target=warm, daemon=True).start()
+        try:
+            server.serve_forever()
+        finally:
+            os.unlink(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stdio", action="store_true", help="serve requests over stdin/stdout (worker mode)")
+    parser.add_argument("--socket", help="serve requests on this Unix socket path")
+    parser.add_argument("--preload", help="module:function to call before importing imagegen (e.g. fake_comfy:install)")
+    args = parser.parse_args()
+    if args.preload:
+        module, function = args.preload.split(":")
+        getattr(importlib.import_module(module), function)()
+    if args.stdio:
+        serve_stdio()
+    elif args.socket:
+        serve_socket(args.socket)
+    else:
+        parser.error("nothing to serve; pass --stdio or --socket")
+
+
+if __name__ == "__main__":
+    main()
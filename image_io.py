@@ -0,0 +1,93 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+from typing import List, Optional, Sequence, Tuple
+
+from PIL import Image
+
+import vars
+from image_store import ImageStore, write_image
+
+OUTPUT_FORMATS = {
+    # mode: (PIL format, file extension)
+    "png": ("PNG", "png"),
+    "webp_lossless": ("WEBP", "webp"),
+    "webp": ("WEBP", "webp"),
+    "jpeg": ("JPEG", "jpg"),
+}
+
+_executor: Optional[Executor] = None
+_slots: Optional[asyncio.Semaphore] = None
+
+
+def encode_image(image: Image.Image, mode: str = "png", png_compress_level: int = 6, quality: int = 92) -> Tuple[bytes, str]:
+    """Encode a PIL image for upload; returns (bytes, file extension)."""
+    pil_format, extension = OUTPUT_FORMATS[mode]
+    options = {}
+    if mode == "png":
+        options["compress_level"] = png_compress_level
+    elif mode == "webp_lossless":
+        options.update(lossless=True, quality=quality, method=4)
+    elif mode == "webp":
+        options.update(quality=quality, method=4)
+    elif mode == "jpeg":
+        options.update(quality=quality, subsampling=0, optimize=False)
+    buffer = BytesIO()
+    image.save(buffer, format=pil_format, **options)
+    return buffer.getvalue(), extension
+
+
+def decode_image(data: bytes) -> Image.Image:
+    with Image.open(BytesIO(data)) as img:
+        return img.convert("RGB").copy()
+
+
+def _get_executor() -> Executor:
+    global _executor, _slots  # noqa: PLW0603
+    if _executor is None:
+        if vars.IMAGE_IO_USE_PROCESSES:
+            _executor = ProcessPoolExecutor(max_workers=vars.IMAGE_IO_WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(max_workers=vars.IMAGE_IO_WORKERS, thread_name_prefix="image-io")
+        _slots = asyncio.Semaphore(vars.IMAGE_IO_MAX_PENDING)
+    return _executor
+
+
+async def _submit(func, *args):
+    executor = _get_executor()
+    # Bound the backlog so a burst of jobs cannot queue unbounded image buffers.
+    async with _slots:
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+
+async def encode_images(images: Sequence[Image.Image], mode: Optional[str] = None) -> List[Tuple[bytes, str]]:
+    """Encode images concurrently off the event loop using the configured output format."""
+    mode = mode or vars.OUTPUT_FORMAT
+    return await asyncio.gather(
+        *(
+            _submit(encode_image, image, mode, vars.PNG_COMPRESS_LEVEL, vars.OUTPUT_QUALITY)
+            for image in images
+        ),
+    )
+
+
+async def store_images(store: ImageStore, images: Sequence[Image.Image]) -> List[str]:
+    """Hash and write images into `store` on the image I/O pool; returns their digests."""
+    written = await asyncio.gather(
+        *(_submit(write_image, image, store.root, store.png_compress_level) for image in images),
+    )
+    for image, (digest, size) in zip(images, written):
+        store.add(digest, image, size)
+    return [digest for digest, _ in written]
+
+
+async def decode_image_async(data: bytes) -> Image.Image:
+    return await _submit(decode_image, data)
+
+
+def shutdown():
+    global _executor, _slots  # noqa: PLW0603
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+    _executor = None
+    _slots = None
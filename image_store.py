@@ -0,0 +1,100 @@
+import hashlib
+import os
+import threading
+from typing import Optional, Tuple
+
+from PIL import Image
+
+from caching import LRUCache
+
+
+def image_digest(image: Image.Image) -> str:
+    """Content address of an image: hash of its mode, size and raw pixels."""
+    digest = hashlib.sha256(f"{image.mode}:{image.width}x{image.height}:".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()[:32]
+
+
+def write_image(image: Image.Image, root: str, png_compress_level: int) -> Tuple[str, Optional[int]]:
+    """Hash an image and save it as `<digest>.png` under `root` unless already there.
+
+    Returns (digest, file size), with size None if the write failed. Touches no ImageStore
+    state, so it can run on the image I/O pool, including a process pool.
+    """
+    digest = image_digest(image)
+    path = os.path.join(root, f"{digest}.png")
+    try:
+        if not os.path.exists(path):
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            image.save(tmp_path, format="PNG", compress_level=png_compress_level)
+            os.replace(tmp_path, path)
+        return digest, os.path.getsize(path)
+    except OSError as e:
+        print(f"Failed to store image {digest}: {e}")
+        return digest, None
+
+
+class ImageStore:
+    """Content-addressed store of generated images.
+
+    Images are kept as lossless PNGs under `root`, evicted least recently used once
+    the directory exceeds `max_bytes`, with a small in-memory hot set of decoded
+    images in front so an upscale right after a generation never touches the disk.
+    """
+
+    def __init__(self, root: str, max_bytes: int, hot_entries: int = 32, png_compress_level: int = 1):
+        self.root = root
+        self.png_compress_level = png_compress_level
+        self._hot = LRUCache(hot_entries, sizeof=lambda image: image.width * image.height * len(image.getbands()))
+        self._files = LRUCache(1 << 30, max_bytes=max_bytes, sizeof=lambda size: size, on_evict=self._unlink)
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._scan()
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.root, f"{digest}.png")
+
+    def _scan(self) -> None:
+        """Rebuild the eviction order from what is already on disk (oldest first)."""
+        entries = []
+        for name in os.listdir(self.root):
+            if not name.endswith(".png"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.root, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, digest, size in sorted(entries):
+            self._files.put(digest, size)
+
+    def _unlink(self, digest: str, _size: int) -> None:
+        try:
+            os.remove(self._path(digest))
+        except OSError:
+            pass
+
+    def add(self, digest: str, image: Image.Image, size: Optional[int]) -> None:
+        """Track an image already written by `write_image` (size None: only kept in memory)."""
+        self._hot.put(digest, image)
+        if size is not None:
+            with self._lock:
+                self._files.put(digest, size)
+
+    def get(self, digest: str) -> Optional[Image.Image]:
+        image = self._hot.get(digest)
+        if image is not None:
+            return image
+        if self._files.get(digest) is None:
+            return None
+        try:
+            with Image.open(self._path(digest)) as img:
+                image = img.convert("RGB").copy()
+        except OSError:
+            self._files.pop(digest)
+            return None
+        self._hot.put(digest, image)
+        return image
+
+    def stats(self):
+        return {"hot": self._hot.stats(), "disk": self._files.stats()}
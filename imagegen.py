@@ -1,39 +1,89 @@
 import os
 import random
 import sys
-from typing import Iterable, List, Optional
+import threading
+from math import lcm
+from typing import Iterable, List, Optional, Sequence, Tuple
 
 import numpy as np
 import torch
 from PIL import Image
 
+import metrics
+import vars
+from caching import LRUCache
 from vars import (
+    CONDITIONING_CACHE_BUDGET_MB,
+    CONDITIONING_CACHE_MAX_ENTRIES,
+    LORA_CACHE_BUDGET_MB,
+    LORA_CACHE_MAX_ENTRIES,
     LORA_CONFIG,
     MODEL_NAME,
     MODEL_PATH,
+    TORCH_COMPILE,
 )
 
 COMFY_PATH = "/home/xr/code/ComfyUI/"
-if COMFY_PATH not in sys.path:
-    sys.path.append(COMFY_PATH)
-
-import folder_paths  # type: ignore
-from nodes import NODE_CLASS_MAPPINGS  # type: ignore
-from comfy_extras.nodes_sd3 import EmptySD3LatentImage as EmptySD3LatentImageClass
-from comfy.utils import set_progress_bar_global_hook
-
-CheckpointLoaderSimple = NODE_CLASS_MAPPINGS["CheckpointLoaderSimple"]()
-CLIPTextEncode = NODE_CLASS_MAPPINGS["CLIPTextEncode"]()
-KSampler = NODE_CLASS_MAPPINGS["KSampler"]()
-VAEDecode = NODE_CLASS_MAPPINGS["VAEDecode"]()
-EmptyLatentImage = NODE_CLASS_MAPPINGS["EmptyLatentImage"]()
-LoraLoader = NODE_CLASS_MAPPINGS["LoraLoader"]()
-VAEEncode = NODE_CLASS_MAPPINGS["VAEEncode"]()
-UNETLoader = NODE_CLASS_MAPPINGS["UNETLoader"]()
-CLIPLoader = NODE_CLASS_MAPPINGS["CLIPLoader"]()
-VAELoader = NODE_CLASS_MAPPINGS["VAELoader"]()
-EmptySD3LatentImage = EmptySD3LatentImageClass()
-ConditioningSetTimestepRange = NODE_CLASS_MAPPINGS["ConditioningSetTimestepRange"]()
+
+# ComfyUI modules and node objects; importing them takes seconds, so _ensure_comfy()
+# fills these in on first use and `import imagegen` stays cheap.
+folder_paths = comfy = model_management = latent_preview = None
+CheckpointLoaderSimple = CLIPTextEncode = KSampler = VAEDecode = EmptyLatentImage = None
+LoraLoader = VAEEncode = UNETLoader = CLIPLoader = VAELoader = LatentUpscale = None
+EmptySD3LatentImage = ConditioningSetTimestepRange = None
+_comfy_lock = threading.Lock()
+_comfy_loaded = False
+
+
+def _ensure_comfy():
+    global folder_paths, comfy, model_management, latent_preview, _comfy_loaded
+    global CheckpointLoaderSimple, CLIPTextEncode, KSampler, VAEDecode, EmptyLatentImage
+    global LoraLoader, VAEEncode, UNETLoader, CLIPLoader, VAELoader, LatentUpscale
+    global EmptySD3LatentImage, ConditioningSetTimestepRange
+    if _comfy_loaded:
+        return
+    with _comfy_lock:
+        if _comfy_loaded:
+            return
+        with metrics.span("comfy_import"):
+            if COMFY_PATH not in sys.path:
+                sys.path.append(COMFY_PATH)
+
+            import folder_paths  # type: ignore
+            from nodes import NODE_CLASS_MAPPINGS  # type: ignore
+            from comfy_extras.nodes_sd3 import EmptySD3LatentImage as EmptySD3LatentImageClass
+            import comfy.utils  # type: ignore
+            import comfy.model_management as model_management  # type: ignore
+            import comfy.sample  # type: ignore
+            import latent_preview  # type: ignore
+
+            CheckpointLoaderSimple = NODE_CLASS_MAPPINGS["CheckpointLoaderSimple"]()
+            CLIPTextEncode = NODE_CLASS_MAPPINGS["CLIPTextEncode"]()
+            KSampler = NODE_CLASS_MAPPINGS["KSampler"]()
+            VAEDecode = NODE_CLASS_MAPPINGS["VAEDecode"]()
+            EmptyLatentImage = NODE_CLASS_MAPPINGS["EmptyLatentImage"]()
+            LoraLoader = NODE_CLASS_MAPPINGS["LoraLoader"]()
+            VAEEncode = NODE_CLASS_MAPPINGS["VAEEncode"]()
+            UNETLoader = NODE_CLASS_MAPPINGS["UNETLoader"]()
+            CLIPLoader = NODE_CLASS_MAPPINGS["CLIPLoader"]()
+            VAELoader = NODE_CLASS_MAPPINGS["VAELoader"]()
+            LatentUpscale = NODE_CLASS_MAPPINGS["LatentUpscale"]()
+            EmptySD3LatentImage = EmptySD3LatentImageClass()
+            ConditioningSetTimestepRange = NODE_CLASS_MAPPINGS["ConditioningSetTimestepRange"]()
+        _comfy_loaded = True
+
+
+def set_progress_bar_global_hook(hook):
+    _ensure_comfy()
+    comfy.utils.set_progress_bar_global_hook(hook)
+
+
+_model_lock = threading.Lock()
+_resident_models = {}
+
+
+def _model_identity():
+    return (MODEL_NAME, MODEL_PATH, TORCH_COMPILE)
 
 
 def _resolve_checkpoint() -> str:
@@ -45,52 +95,129 @@ def _resolve_checkpoint() -> str:
         return MODEL_PATH or candidate
 
 
-def _apply_loras(model, clip, lora_keys: Iterable[str]):
-    for key in lora_keys:
+def _lora_patch_key(lora_keys: Optional[Iterable[str]]) -> Tuple[Tuple[str, float], ...]:
+    """Resolve preset names into the ordered (lora file, strength) stack they patch in."""
+    entries = []
+    for key in lora_keys or ():
         for entry in LORA_CONFIG.get(key, []):
             lora_name = entry.get("lora")
             if not lora_name:
                 continue
             strength = float(entry.get("strength", entry.get("strenght", 0.75)))
+            entries.append((lora_name, strength))
+    return tuple(entries)
+
+
+def _lora_stack_nbytes(patch_key) -> int:
+    total = 0
+    for lora_name, _ in patch_key:
+        try:
+            total += os.path.getsize(folder_paths.get_full_path("loras", lora_name))
+        except Exception:  # noqa: BLE001 - size is only an estimate
+            continue
+    return total
+
+
+def _release_lora_variant(key, variant):
+    model_management.soft_empty_cache()
+
+
+_lora_variants = LRUCache(
+    LORA_CACHE_MAX_ENTRIES,
+    max_bytes=LORA_CACHE_BUDGET_MB * 1024 * 1024,
+    sizeof=lambda variant: variant[2],
+    on_evict=_release_lora_variant,
+)
+
+
+def _apply_loras(model, clip, patch_key):
+    cache_key = (_model_identity(), patch_key)
+    cached = _lora_variants.get(cache_key)
+    if cached is not None:
+        return cached[0], cached[1]
+    with metrics.span("lora_patch"):
+        for lora_name, strength in patch_key:
             model, clip = LoraLoader.load_lora(model, clip, lora_name, strength, strength)
+    _lora_variants.put(cache_key, (model, clip, _lora_stack_nbytes(patch_key)))
     return model, clip
 
 
-def _decoded_batch_to_pil(decoded_batch: torch.Tensor) -> List[Image.Image]:
-    batch_np = decoded_batch.detach().cpu().numpy()
-    batch_np = np.clip(batch_np, 0.0, 1.0)
-    batch_np = (batch_np * 255).astype(np.uint8)
-    return [Image.fromarray(sample) for sample in batch_np]
+def _conditioning_nbytes(conditioning) -> int:
+    total = 0
+    for tensor, extras in conditioning:
+        total += tensor.element_size() * tensor.nelement()
+        for value in extras.values():
+            if isinstance(value, torch.Tensor):
+                total += value.element_size() * value.nelement()
+    return total
+
 
+_conditioning_cache = LRUCache(
+    CONDITIONING_CACHE_MAX_ENTRIES,
+    max_bytes=CONDITIONING_CACHE_BUDGET_MB * 1024 * 1024,
+    sizeof=_conditioning_nbytes,
+)
 
-def _pil_to_tensor(image: Image.Image) -> torch.Tensor:
-    np_image = np.array(image.convert("RGB"), dtype=np.float32) / 255.0
-    np_image = np.expand_dims(np_image, axis=0)
-    return torch.from_numpy(np_image)
 
+def _encode_text(clip, text: str, patch_key):
+    cache_key = (_model_identity(), patch_key, text)
+    conditioning = _conditioning_cache.get(cache_key)
+    if conditioning is None:
+        with metrics.span("clip_encode"):
+            conditioning = CLIPTextEncode.encode(clip, text)[0]
+        _conditioning_cache.put(cache_key, conditioning)
+    return conditioning
 
-def preprocess_gen_args(gen_args, default_args):
-    assert 'prompt' in gen_args and 'neg_prompt' in gen_args
 
-    for key, value in default_args.items():
-        gen_args.setdefault(key, value)
+def conditioning_cache_stats():
+    return _conditioning_cache.stats()
 
-    if 'seed' not in gen_args or gen_args['seed'] is None:
-        gen_args['seed'] = random.randint(0, 2**32 - 1)
 
-    if 'lora' in gen_args:
-        value = gen_args['lora']
-        names = [value] if isinstance(value, str) else list(value)
-        filtered = tuple(name for name in names if name)
-        if filtered:
-            gen_args['lora'] = filtered
-        else:
-            gen_args.pop('lora')
+_PIL_MODES = {1: "L", 3: "RGB", 4: "RGBA"}
 
-    return gen_args
 
+def _quantize(decoded_batch: torch.Tensor) -> torch.Tensor:
+    """Clamp/scale/truncate to uint8 where the tensor lives, in place; returns a contiguous CPU tensor.
 
-def _prepare_model(lora_keys: Optional[List[str]]):
+    Consumes `decoded_batch` (VAE output nobody reads afterwards). Only the uint8 result
+    crosses to the host, through pinned memory when decoding happened on the GPU.
+    """
+    with torch.inference_mode():
+        pixels = decoded_batch.detach()
+        if pixels.dtype != torch.float32:
+            pixels = pixels.float()
+        quantized = pixels.clamp_(0.0, 1.0).mul_(255.0).to(torch.uint8)
+        if quantized.device.type == "cpu":
+            return quantized.contiguous()
+        # torch's caching host allocator recycles the pinned block once the images are freed.
+        staging = torch.empty(quantized.shape, dtype=torch.uint8, pin_memory=True)
+        staging.copy_(quantized, non_blocking=True)
+        torch.cuda.current_stream(quantized.device).synchronize()
+        return staging
+
+
+def _decoded_batch_to_pil(decoded_batch: torch.Tensor) -> List[Image.Image]:
+    with metrics.span("to_pil"):
+        pixels = _quantize(decoded_batch).numpy()
+        mode = _PIL_MODES[pixels.shape[-1]]
+        height, width = pixels.shape[1:3]
+        # Each image unpacks straight from the uint8 batch into its own pageable buffer, so caches
+        # holding one image never pin the whole (possibly pinned) staging block.
+        return [Image.frombytes(mode, (width, height), sample, "raw", mode, 0, 1) for sample in pixels]
+
+
+def _pil_batch_to_tensor(images: Sequence[Image.Image]) -> torch.Tensor:
+    """(batch, height, width, 3) float32 in [0, 1] from equally sized images, filled in place."""
+    width, height = images[0].size
+    pixels = torch.empty((len(images), height, width, 3), dtype=torch.float32)
+    target = pixels.numpy()
+    for index, image in enumerate(images):
+        rgb = image if image.mode == "RGB" else image.convert("RGB")
+        np.copyto(target[index], np.asarray(rgb), casting="unsafe")
+    return pixels.div_(255.0)
+
+
+def _load_base_model():
     if MODEL_NAME == "z_image":
         model = UNETLoader.load_unet("z_image_turbo_bf16.safetensors", "default")[0]
         #clip = CLIPLoader.load_clip("qwen_3_4b.safetensors", "stable_diffusion", "default")[0]
@@ -98,12 +225,114 @@ def _prepare_model(lora_keys: Optional[List[str]]):
         vae = VAELoader.load_vae("ae.safetensors")[0]
     else:
         model, clip, vae = CheckpointLoaderSimple.load_checkpoint(_resolve_checkpoint())[:3]
-    if lora_keys:
-        model, clip = _apply_loras(model, clip, lora_keys)
     return model, clip, vae
 
 
-def generate_images(gen_args):
+def _accelerated() -> bool:
+    """Warm-up samples and torch.compile only pay off on a GPU; CPU-only machines skip them."""
+    return torch.cuda.is_available()
+
+
+def _compile_model(model):
+    """Patch in a torch.compile'd diffusion model; compilation itself happens on the first sample."""
+    compiled = model.clone()
+    diffusion_model = compiled.get_model_object("diffusion_model")
+    compiled.add_object_patch("diffusion_model", torch.compile(diffusion_model, mode=vars.TORCH_COMPILE_MODE))
+    return compiled
+
+
+def get_base_model():
+    """Return the resident (model, clip, vae) for the configured model, loading it once."""
+    _ensure_comfy()
+    identity = _model_identity()
+    with _model_lock:
+        cached = _resident_models.get(identity)
+        if cached is None:
+            with metrics.span("model_load"):
+                cached = _load_base_model()
+            if TORCH_COMPILE and _accelerated():
+                cached = (_compile_model(cached[0]), *cached[1:])
+            _resident_models.clear()
+            _resident_models[identity] = cached
+        return cached
+
+
+def invalidate_model_cache():
+    """Drop resident weights so the next job reloads them from disk."""
+    with _model_lock:
+        _resident_models.clear()
+    _lora_variants.clear()
+    _conditioning_cache.clear()
+    if _comfy_loaded:
+        model_management.unload_all_models()
+        model_management.soft_empty_cache()
+
+
+def _warmup_sizes() -> List[Tuple[int, int]]:
+    names = vars.WARMUP_DIMENSIONS or list(vars.DIMENSION_PRESETS)
+    sizes = [(vars.txt2img_args['width'], vars.txt2img_args['height'])]
+    sizes += [vars.DIMENSION_PRESETS[name] for name in names if name in vars.DIMENSION_PRESETS]
+    return list(dict.fromkeys(sizes))
+
+
+def _warm_samples() -> int:
+    """One WARMUP_STEPS-step txt2img job per size, then a weak and a hard upscale of its image."""
+    runs = 0
+    prompt = {'prompt': "warm-up", 'neg_prompt': "", 'seed': 0, 'steps': vars.WARMUP_STEPS}
+    for width, height in _warmup_sizes():
+        images = generate_images_batch([dict(vars.txt2img_args, **prompt, width=width, height=height)])[0]
+        runs += 1
+        for preset in (vars.upscale_weak_args, vars.upscale_hard_args):
+            upscale_images(images[:1], dict(preset, **prompt))
+            runs += 1
+    return runs
+
+
+def warm_up(samples: Optional[bool] = None):
+    """Import ComfyUI and load the base model now instead of on the first job; returns stage timings.
+
+    With WARMUP_SAMPLES (or `samples`) on a GPU, also runs a tiny job per dimension preset
+    and job type, so kernel selection, autotuning, allocator growth and torch.compile
+    happen here rather than in users' first jobs.
+    """
+    timings = {}
+    with metrics.collect(timings):
+        get_base_model()
+        if (vars.WARMUP_SAMPLES if samples is None else samples) and _accelerated():
+            # Keep the per-node spans of the dummy jobs out of the startup report.
+            with metrics.span("warmup"), metrics.collect({}):
+                timings["warmup_jobs"] = _warm_samples()
+    return timings
+
+
+def reload_config():
+    """Pick up MODEL_NAME/MODEL_PATH/LORA_CONFIG from a reloaded vars module."""
+    global MODEL_NAME, MODEL_PATH, LORA_CONFIG, TORCH_COMPILE
+    previous = _model_identity()
+    MODEL_NAME, MODEL_PATH, LORA_CONFIG = vars.MODEL_NAME, vars.MODEL_PATH, vars.LORA_CONFIG
+    TORCH_COMPILE = vars.TORCH_COMPILE
+    _lora_variants.max_entries = vars.LORA_CACHE_MAX_ENTRIES
+    _lora_variants.max_bytes = vars.LORA_CACHE_BUDGET_MB * 1024 * 1024
+    _conditioning_cache.max_entries = vars.CONDITIONING_CACHE_MAX_ENTRIES
+    _conditioning_cache.max_bytes = vars.CONDITIONING_CACHE_BUDGET_MB * 1024 * 1024
+    if _model_identity() != previous:
+        invalidate_model_cache()
+
+
+def _prepare_model(lora_keys: Optional[List[str]]):
+    model, clip, vae = get_base_model()
+    patch_key = _lora_patch_key(lora_keys)
+    if patch_key:
+        model, clip = _apply_loras(model, clip, patch_key)
+    return model, clip, vae, patch_key
+
+
+def _split_latents(samples: torch.Tensor, count: int) -> List[torch.Tensor]:
+    """Per-image CPU copies of sampled latents, for later latent-space upscaling."""
+    return [samples[index:index + 1].to("cpu", copy=True) for index in range(count)]
+
+
+def generate_images(gen_args, latents_out: Optional[list] = None):
     batch_size = gen_args.get('batch_size', 1)
     sampler_name = gen_args.get('sampler_name', 'euler')
     scheduler = gen_args.get('scheduler', 'normal')
@@ -111,9 +340,9 @@ def generate_images(gen_args):
     use_noise = gen_args.get('noise', False)
 
     with torch.inference_mode():
-        model, clip, vae = _prepare_model(gen_args.get('lora'))
-        positive = CLIPTextEncode.encode(clip, gen_args['prompt'])[0]
-        negative = CLIPTextEncode.encode(clip, gen_args['neg_prompt'])[0]
+        model, clip, vae, patch_key = _prepare_model(gen_args.get('lora'))
+        positive = _encode_text(clip, gen_args['prompt'], patch_key)
+        negative = _encode_text(clip, gen_args['neg_prompt'], patch_key)
 
         if MODEL_NAME == "z_image" and use_noise:
             positive = ConditioningSetTimestepRange.set_range(positive, 0.1, 1.0)[0]
@@ -131,60 +360,275 @@ def generate_images(gen_args):
                 gen_args['height'],
                 batch_size=batch_size,
             )[0]
-        sampled = KSampler.sample(
-            model=model,
-            seed=base_seed,
-            steps=gen_args['steps'],
-            cfg=gen_args['cfg'],
-            sampler_name=sampler_name,
-            scheduler=scheduler,
-            positive=positive,
-            negative=negative,
-            latent_image=latent,
-            denoise=1.0,
-        )[0]
-        decoded = VAEDecode.decode(vae, sampled)[0]
-        return _decoded_batch_to_pil(decoded)[:batch_size]
+        with metrics.span("ksampler"):
+            sampled = KSampler.sample(
+                model=model,
+                seed=base_seed,
+                steps=gen_args['steps'],
+                cfg=gen_args['cfg'],
+                sampler_name=sampler_name,
+                scheduler=scheduler,
+                positive=positive,
+                negative=negative,
+                latent_image=latent,
+                denoise=1.0,
+            )[0]
+        if latents_out is not None:
+            latents_out.extend(_split_latents(sampled["samples"], batch_size))
+        with metrics.span("vae_decode"):
+            decoded = VAEDecode.decode(vae, sampled)[0]
+        return _decoded_batch_to_pil(decoded[:batch_size])
 
     return []
 
 
-def img2img(image, gen_args):
+def _batch_conditioning(conditionings, counts):
+    """Stack per-job conditionings so sample i of the latent batch sees its own prompt."""
+    if any(len(cond) != 1 for cond in conditionings):
+        raise ValueError("multi-area conditioning cannot be batched")
+    tensors = [cond[0][0] for cond in conditionings]
+    extras = [cond[0][1] for cond in conditionings]
+    lengths = {tensor.shape[1] for tensor in tensors}
+    if len(lengths) > 1 and (MODEL_NAME == "z_image" or any("attention_mask" in extra for extra in extras)):
+        raise ValueError("prompts of different token lengths cannot be batched for this text encoder")
+    target = lcm(*lengths)
+    stacked = torch.cat(
+        [tensor.repeat(count, target // tensor.shape[1], 1) for tensor, count in zip(tensors, counts)],
+    )
+
+    merged = {}
+    for key in extras[0]:
+        values = [extra.get(key) for extra in extras]
+        if all(isinstance(value, torch.Tensor) for value in values):
+            merged[key] = torch.cat(
+                [value.repeat(count, *([1] * (value.dim() - 1))) for value, count in zip(values, counts)],
+            )
+        elif all(value == values[0] for value in values):
+            merged[key] = values[0]
+        else:
+            raise ValueError(f"conditioning field {key!r} differs between jobs")
+    return [[stacked, merged]]
+
+
+def generate_images_batch(
+    gen_args_list: Sequence[dict], latents_out: Optional[list] = None,
+) -> List[List[Image.Image]]:
+    """Sample several compatible txt2img jobs in one KSampler pass.
+
+    Jobs must share size, steps, cfg, sampler, scheduler and LoRA stack; each keeps its
+    own prompt, negative prompt, batch size and seed. The sampler must be deterministic,
+    since stochastic ones draw per-step noise from the first job's seed. Falls back to
+    one pass per job when the conditionings cannot be stacked. If given, `latents_out`
+    receives each image's sampled latent in output order.
+    """
+    if len(gen_args_list) == 1:
+        return [generate_images(gen_args_list[0], latents_out)]
+
+    first = gen_args_list[0]
+    counts = [gen_args.get('batch_size', 1) for gen_args in gen_args_list]
+    total = sum(counts)
+
+    with torch.inference_mode():
+        model, clip, vae, patch_key = _prepare_model(first.get('lora'))
+        try:
+            positive = _batch_conditioning(
+                [_encode_text(clip, gen_args['prompt'], patch_key) for gen_args in gen_args_list], counts,
+            )
+            negative = _batch_conditioning(
+                [_encode_text(clip, gen_args['neg_prompt'], patch_key) for gen_args in gen_args_list], counts,
+            )
+        except ValueError:
+            return [generate_images(gen_args, latents_out) for gen_args in gen_args_list]
+
+        if MODEL_NAME == "z_image" and first.get('noise', False):
+            positive = ConditioningSetTimestepRange.set_range(positive, 0.1, 1.0)[0]
+            negative = ConditioningSetTimestepRange.set_range(negative, 0.1, 1.0)[0]
+
+        if MODEL_NAME == "z_image":
+            latent = EmptySD3LatentImage.generate(first['width'], first['height'], total)[0]
+        else:
+            latent = EmptyLatentImage.generate(first['width'], first['height'], batch_size=total)[0]
+        latent_image = comfy.sample.fix_empty_latent_channels(model, latent["samples"])
+
+        # Noise per job from its own seed, matching what a solo KSampler run would draw.
+        noise_parts = []
+        offset = 0
+        for gen_args, count in zip(gen_args_list, counts):
+            noise_parts.append(comfy.sample.prepare_noise(latent_image[offset:offset + count], gen_args['seed']))
+            offset += count
+        noise = torch.cat(noise_parts)
+
+        callback = latent_preview.prepare_callback(model, first['steps'])
+        with metrics.span("ksampler"):
+            samples = comfy.sample.sample(
+                model,
+                noise,
+                first['steps'],
+                first['cfg'],
+                first.get('sampler_name', 'euler'),
+                first.get('scheduler', 'normal'),
+                positive,
+                negative,
+                latent_image,
+                denoise=1.0,
+                callback=callback,
+                disable_pbar=not comfy.utils.PROGRESS_BAR_ENABLED,
+                seed=first['seed'],
+            )
+        if latents_out is not None:
+            latents_out.extend(_split_latents(samples, total))
+        with metrics.span("vae_decode"):
+            decoded = VAEDecode.decode(vae, {"samples": samples})[0]
+        images = _decoded_batch_to_pil(decoded)
+
+    results = []
+    offset = 0
+    for count in counts:
+        results.append(images[offset:offset + count])
+        offset += count
+    return results
+
+
+def _img2img_sample(gen_args, make_latent) -> List[Image.Image]:
+    """Partially denoise the latent batch built by `make_latent(vae)` and decode it."""
     sampler_name = gen_args.get('sampler_name', 'euler')
     scheduler = gen_args.get('scheduler', 'normal')
     seed = gen_args.get('seed', random.randint(0, 2**32 - 1))
 
     with torch.inference_mode():
-        model, clip, vae = _prepare_model(gen_args.get('lora'))
-        positive = CLIPTextEncode.encode(clip, gen_args['prompt'])[0]
-        negative = CLIPTextEncode.encode(clip, gen_args['neg_prompt'])[0]
-        latent = VAEEncode.encode(vae, _pil_to_tensor(image))[0]
-
-        sampled = KSampler.sample(
-            model=model,
-            seed=seed,
-            steps=gen_args['steps'],
-            cfg=gen_args['cfg'],
-            sampler_name=sampler_name,
-            scheduler=scheduler,
-            positive=positive,
-            negative=negative,
-            latent_image=latent,
-            denoise=gen_args['denoising_strength'],
-        )[0]
-        decoded = VAEDecode.decode(vae, sampled)[0]
-        result_images = _decoded_batch_to_pil(decoded)
-
-    return result_images[0]
-
-
-def upscale_image(image, gen_args):
-    upscaled_width = int(image.size[0] * gen_args['scale'])
-    upscaled_height = int(image.size[1] * gen_args['scale'])
+        model, clip, vae, patch_key = _prepare_model(gen_args.get('lora'))
+        positive = _encode_text(clip, gen_args['prompt'], patch_key)
+        negative = _encode_text(clip, gen_args['neg_prompt'], patch_key)
+        latent = make_latent(vae)
+
+        with metrics.span("ksampler"):
+            sampled = KSampler.sample(
+                model=model,
+                seed=seed,
+                steps=gen_args['steps'],
+                cfg=gen_args['cfg'],
+                sampler_name=sampler_name,
+                scheduler=scheduler,
+                positive=positive,
+                negative=negative,
+                latent_image=latent,
+                denoise=gen_args['denoising_strength'],
+            )[0]
+        with metrics.span("vae_decode"):
+            decoded = VAEDecode.decode(vae, sampled)[0]
+        return _decoded_batch_to_pil(decoded)
+
+
+def _img2img_batch(images: Sequence[Image.Image], gen_args) -> List[Image.Image]:
+    """Run img2img on equally sized images as one latent batch."""
+    def encode(vae):
+        with metrics.span("vae_encode"):
+            pixels = _pil_batch_to_tensor(images)
+            return VAEEncode.encode(vae, pixels)[0]
+
+    return _img2img_sample(gen_args, encode)
+
+
+def img2img(image, gen_args):
+    return _img2img_batch([image], gen_args)[0]
+
+
+def latent_img2img(latent: torch.Tensor, width: int, height: int, gen_args) -> List[Image.Image]:
+    """img2img from sampled latents resized in latent space (no VAE encode or PIL resize)."""
+    def resize(_vae):
+        with metrics.span("latent_upscale"):
+            return LatentUpscale.upscale({"samples": latent}, vars.LATENT_UPSCALE_METHOD, width, height, "disabled")[0]
+
+    return _img2img_sample(gen_args, resize)
+
+
+def _tile_span(length: int) -> Tuple[int, List[int]]:
+    """Tile edge and evenly spread start offsets covering [0, length) with at least the configured overlap.
+
+    An edge within one tile plus the overlap is a single tile; longer edges use the fewest
+    tiles of at most UPSCALE_TILE_SIZE, shrunk so they do not overlap more than needed.
+    """
+    overlap = vars.UPSCALE_TILE_OVERLAP
+    if length <= vars.UPSCALE_TILE_SIZE + overlap:
+        return length // 16 * 16, [0]
+    stride = max(16, vars.UPSCALE_TILE_SIZE - overlap)
+    count = -(-(length - vars.UPSCALE_TILE_SIZE) // stride) + 1
+    tile = -(-(length + (count - 1) * overlap) // count)
+    tile = min(vars.UPSCALE_TILE_SIZE, -(-tile // 16) * 16)
+    return tile, [round(index * (length - tile) / (count - 1)) // 8 * 8 for index in range(count)]
+
+
+def _feather_mask(width: int, height: int, left: bool, top: bool, right: bool, bottom: bool) -> np.ndarray:
+    ramp = max(1, vars.UPSCALE_TILE_OVERLAP)
+    mask_x = np.ones(width, dtype=np.float32)
+    mask_y = np.ones(height, dtype=np.float32)
+    edge = (np.arange(ramp, dtype=np.float32) + 1) / (ramp + 1)
+    if left:
+        mask_x[:ramp] = np.minimum(mask_x[:ramp], edge[:width])
+    if right:
+        mask_x[-ramp:] = np.minimum(mask_x[-ramp:], edge[::-1][-width:])
+    if top:
+        mask_y[:ramp] = np.minimum(mask_y[:ramp], edge[:height])
+    if bottom:
+        mask_y[-ramp:] = np.minimum(mask_y[-ramp:], edge[::-1][-height:])
+    return (mask_y[:, None] * mask_x[None, :])[..., None]
+
+
+def tiled_img2img(image: Image.Image, gen_args) -> Image.Image:
+    """img2img over overlapping tiles, sampled UPSCALE_TILE_BATCH at a time and feather-blended.
+
+    Peak memory depends on the tile size rather than the output size.
+    """
+    width, height = image.size
+    tile_w, xs = _tile_span(width)
+    tile_h, ys = _tile_span(height)
+    boxes = [(x, y, x + tile_w, y + tile_h) for y in ys for x in xs]
+
+    canvas = np.zeros((height, width, 3), dtype=np.float32)
+    weights = np.zeros((height, width, 1), dtype=np.float32)
+    batch = max(1, vars.UPSCALE_TILE_BATCH)
+    for start in range(0, len(boxes), batch):
+        chunk = boxes[start:start + batch]
+        tiles = _img2img_batch([image.crop(box) for box in chunk], gen_args)
+        for (x0, y0, x1, y1), tile in zip(chunk, tiles):
+            mask = _feather_mask(tile_w, tile_h, x0 > 0, y0 > 0, x1 < width, y1 < height)
+            canvas[y0:y1, x0:x1] += np.asarray(tile, dtype=np.float32) * mask
+            weights[y0:y1, x0:x1] += mask
+    blended = canvas / np.maximum(weights, 1e-6)
+    return Image.fromarray(np.clip(blended + 0.5, 0, 255).astype(np.uint8))
+
+
+def upscale_images(
+    images: Sequence[Image.Image], gen_args, latents: Optional[Sequence[Optional[torch.Tensor]]] = None,
+) -> List[Image.Image]:
+    """Upscale then refine with img2img, sampling up to UPSCALE_BATCH same-sized images per pass.
+
+    With 'latent' set in gen_args and every image's sampled latent available, the resize
+    happens in latent space; otherwise (e.g. external images) in pixel space.
+    """
+    latents = list(latents or [None] * len(images))
+    if any(image.size != images[0].size for image in images):
+        return [upscale_images([image], gen_args, [latent])[0] for image, latent in zip(images, latents)]
+
+    upscaled_width = int(images[0].size[0] * gen_args['scale'])
+    upscaled_height = int(images[0].size[1] * gen_args['scale'])
 
     upscaled_width -= upscaled_width % 16
     upscaled_height -= upscaled_height % 16
 
-    resized_image = image.resize((upscaled_width, upscaled_height), Image.LANCZOS)
-
-    return img2img(resized_image, gen_args)
\ No newline at end of file
+    tiled = gen_args.get('tiled') and max(upscaled_width, upscaled_height) > vars.UPSCALE_TILE_SIZE + vars.UPSCALE_TILE_OVERLAP
+    batch = max(1, vars.UPSCALE_BATCH)
+    results = []
+    if gen_args.get('latent') and not tiled and all(latent is not None for latent in latents):
+        for start in range(0, len(latents), batch):
+            stacked = torch.cat(latents[start:start + batch])
+            results.extend(latent_img2img(stacked, upscaled_width, upscaled_height, gen_args))
+        return results
+
+    resized_images = [image.resize((upscaled_width, upscaled_height), Image.LANCZOS) for image in images]
+
+    if tiled:
+        return [tiled_img2img(resized_image, gen_args) for resized_image in resized_images]
+    for start in range(0, len(resized_images), batch):
+        results.extend(_img2img_batch(resized_images[start:start + batch], gen_args))
+    return results
@@ -0,0 +1,103 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Sequence
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created REAL NOT NULL,
+    job_type TEXT NOT NULL,
+    gen_args TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    channel_id INTEGER,
+    message_id INTEGER,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS job_images (
+    job_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (job_id, position)
+);
+"""
+
+
+class JournalEntry:
+    def __init__(self, row, base_images: List[bytes]):
+        self.id, self.created, self.job_type, gen_args, self.user_id, self.channel_id, self.message_id, \
+            self.attempts = row
+        self.gen_args = json.loads(gen_args)
+        self.base_images = base_images
+
+
+class JobJournal:
+    """On-disk record of queued jobs so they survive a crash or restart.
+
+    A job is added when it is enqueued and deleted once it has been published (or
+    has failed), so the table only ever holds outstanding work.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def add(
+        self,
+        job_type: str,
+        gen_args: dict,
+        user_id: int,
+        channel_id: Optional[int],
+        message_id: Optional[int] = None,
+        base_images: Sequence[bytes] = (),
+    ) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (created, job_type, gen_args, user_id, channel_id, message_id) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (time.time(), job_type, json.dumps(gen_args), user_id, channel_id, message_id),
+            )
+            self._conn.executemany(
+                "INSERT INTO job_images (job_id, position, data) VALUES (?, ?, ?)",
+                [(cursor.lastrowid, position, data) for position, data in enumerate(base_images)],
+            )
+            return cursor.lastrowid
+
+    def update(self, job_id: int, gen_args: dict) -> None:
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET gen_args = ? WHERE id = ?", (json.dumps(gen_args), job_id))
+
+    def complete(self, job_id: int) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            self._conn.execute("DELETE FROM job_images WHERE job_id = ?", (job_id,))
+
+    def replay(self, max_attempts: int) -> List[JournalEntry]:
+        """Return outstanding jobs oldest first, counting this as another attempt.
+
+        Jobs that already crashed the bot `max_attempts` times are dropped.
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE attempts >= ?", (max_attempts,))
+            self._conn.execute("DELETE FROM job_images WHERE job_id NOT IN (SELECT id FROM jobs)")
+            self._conn.execute("UPDATE jobs SET attempts = attempts + 1")
+            rows = self._conn.execute(
+                "SELECT id, created, job_type, gen_args, user_id, channel_id, message_id, attempts "
+                "FROM jobs ORDER BY id",
+            ).fetchall()
+            images = {}
+            for job_id, data in self._conn.execute("SELECT job_id, data FROM job_images ORDER BY job_id, position"):
+                images.setdefault(job_id, []).append(data)
+        return [JournalEntry(row, images.get(row[0], [])) for row in rows]
+
+    def compact(self) -> None:
+        with self._lock:
+            self._conn.execute("VACUUM")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
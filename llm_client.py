@@ -0,0 +1,138 @@
+import asyncio
+import hashlib
+import importlib.util
+import random
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+import httpx
+
+from caching import LRUCache
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class LLMClient:
+    """Chat-completions client shared by every prompt enhancement.
+
+    One pooled httpx client (HTTP/2 when `h2` is installed) is reused for all calls,
+    at most `max_concurrency` requests are in flight, 429/5xx responses and transport
+    errors are retried with exponential backoff, and completions are cached by
+    (model, template hash, prompt) in an in-memory LRU backed by SQLite.
+    """
+
+    def __init__(
+        self,
+        api_url: str,
+        api_key: str,
+        cache_path: Optional[str] = None,
+        cache_size: int = 512,
+        max_concurrency: int = 4,
+        max_retries: int = 3,
+        timeout: float = 30.0,
+    ):
+        self.api_url = api_url
+        self.api_key = api_key
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self._max_concurrency = max_concurrency
+        self._client: Optional[httpx.AsyncClient] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._cache = LRUCache(cache_size)
+        self._lock = threading.Lock()
+        self._conn = None
+        if cache_path:
+            self._conn = sqlite3.connect(cache_path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, completion TEXT NOT NULL, created REAL NOT NULL)",
+            )
+        self._pending: Dict[str, asyncio.Task] = {}
+        self.requests = 0
+        self.retries = 0
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=importlib.util.find_spec("h2") is not None,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self._max_concurrency, keepalive_expiry=120.0),
+                headers={"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"},
+            )
+            self._slots = asyncio.Semaphore(self._max_concurrency)
+        return self._client
+
+    @staticmethod
+    def cache_key(model: str, template: str, prompt: str) -> str:
+        template_hash = hashlib.sha256(template.encode()).hexdigest()[:16]
+        return hashlib.sha256(f"{model}\0{template_hash}\0{prompt}".encode()).hexdigest()
+
+    def _cached(self, key: str) -> Optional[str]:
+        completion = self._cache.get(key)
+        if completion is not None or self._conn is None:
+            return completion
+        with self._lock:
+            row = self._conn.execute("SELECT completion FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._cache.put(key, row[0])
+        return row[0]
+
+    def _store(self, key: str, completion: str) -> None:
+        self._cache.put(key, completion)
+        if self._conn is not None:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, completion, created) VALUES (?, ?, ?)",
+                    (key, completion, time.time()),
+                )
+
+    async def complete(self, model: str, template: str, prompt: str) -> str:
+        """Completion for `template.format(prompt=prompt)`, from cache when seen before."""
+        key = self.cache_key(model, template, prompt)
+        cached = await asyncio.to_thread(self._cached, key)
+        if cached is not None:
+            return cached
+        # Identical prompts submitted while a request is in flight share it.
+        task = self._pending.get(key)
+        if task is None:
+            payload = {"model": model, "messages": [{"role": "user", "content": template.format(prompt=prompt)}]}
+            task = self._pending[key] = asyncio.ensure_future(self._fetch(key, payload))
+            task.add_done_callback(lambda _: self._pending.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key: str, payload: dict) -> str:
+        data = await self._post(payload)
+        completion = data["choices"][0]["message"]["content"].strip()
+        await asyncio.to_thread(self._store, key, completion)
+        return completion
+
+    async def _post(self, payload: dict) -> dict:
+        client = self._http()
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            try:
+                async with self._slots:
+                    self.requests += 1
+                    response = await client.post(self.api_url, json=payload)
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    response.raise_for_status()
+                    return response.json()
+                retry_after = response.headers.get("Retry-After")
+            except httpx.TransportError:
+                if attempt == self.max_retries:
+                    raise
+            self.retries += 1
+            try:
+                delay = float(retry_after)
+            except (TypeError, ValueError):
+                delay = 0.5 * 2 ** attempt * (1 + random.random())
+            await asyncio.sleep(min(delay, 30.0))
+        raise RuntimeError("unreachable")
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,146 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+from caching import LRUCache
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    message_id INTEGER PRIMARY KEY,
+    channel_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    job_type TEXT NOT NULL,
+    gen_args TEXT NOT NULL,
+    image_refs TEXT NOT NULL,
+    triggered TEXT NOT NULL,
+    created REAL NOT NULL,
+    image_digests TEXT NOT NULL
+)
+"""
+
+
+class MessageRecord:
+    """What the bot posted in one output message: the exact arguments and where its images live."""
+
+    def __init__(
+        self,
+        message_id,
+        channel_id,
+        user_id,
+        job_type,
+        gen_args,
+        image_refs=None,
+        triggered=None,
+        created=None,
+        image_digests=None,
+    ):
+        self.message_id = message_id
+        self.channel_id = channel_id
+        self.user_id = user_id
+        self.job_type = job_type
+        self.gen_args = gen_args
+        self.image_refs: List[str] = list(image_refs or [])
+        self.triggered = set(triggered or ())
+        self.created = created or time.time()
+        # ImageStore digests of the posted images, parallel to image_refs.
+        self.image_digests: List[str] = list(image_digests or [])
+
+
+class MessageIndex:
+    """Output message ID -> MessageRecord, with a bounded in-memory LRU in front of SQLite."""
+
+    def __init__(self, path: Optional[str], cache_size: int = 1000):
+        self._cache = LRUCache(cache_size)
+        self._lock = threading.RLock()
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(SCHEMA)
+
+    def add(self, record: MessageRecord) -> None:
+        with self._lock:
+            existing = self._cache.get(record.message_id)
+            if existing is not None:
+                record.triggered |= existing.triggered
+            self._cache.put(record.message_id, record)
+        self._write(record)
+
+    def get(self, message_id: int) -> Optional[MessageRecord]:
+        record = self._cache.get(message_id)
+        if record is not None or self._conn is None:
+            return record
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT message_id, channel_id, user_id, job_type, gen_args, image_refs, triggered, created, image_digests "
+                "FROM messages WHERE message_id = ?",
+                (message_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        record = MessageRecord(
+            row[0], row[1], row[2], row[3], json.loads(row[4]), json.loads(row[5]), json.loads(row[6]), row[7],
+            json.loads(row[8]),
+        )
+        self._cache.put(message_id, record)
+        return record
+
+    def mark_triggered(self, record: MessageRecord, emoji: str) -> bool:
+        """Remember that `emoji` already started a job for this message; False if it had.
+
+        Checked and set in one UPDATE, so concurrent reactions agree even when each built
+        its own record (cache miss, legacy message).
+        """
+        with self._lock:
+            if self._conn is None:
+                record = self._cache.get(record.message_id) or record
+                if emoji in record.triggered:
+                    return False
+                record.triggered.add(emoji)
+                return True
+            marked = self._conn.execute(
+                "UPDATE messages SET triggered = json_insert(triggered, '$[#]', ?) "
+                "WHERE message_id = ? AND NOT EXISTS (SELECT 1 FROM json_each(messages.triggered) WHERE value = ?)",
+                (emoji, record.message_id, emoji),
+            ).rowcount == 1
+        if marked:
+            record.triggered.add(emoji)
+        return marked
+
+    def remove(self, message_id: int) -> None:
+        self._cache.pop(message_id)
+        if self._conn is not None:
+            with self._lock:
+                self._conn.execute("DELETE FROM messages WHERE message_id = ?", (message_id,))
+
+    def prune(self, max_age_days: float) -> None:
+        if self._conn is not None:
+            with self._lock:
+                self._conn.execute("DELETE FROM messages WHERE created < ?", (time.time() - max_age_days * 86400,))
+
+    def _write(self, record: MessageRecord) -> None:
+        if self._conn is None:
+            return
+        with self._lock:
+            # An existing row keeps its triggered set; only mark_triggered adds to it.
+            self._conn.execute(
+                "INSERT INTO messages "
+                "(message_id, channel_id, user_id, job_type, gen_args, image_refs, triggered, created, image_digests) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(message_id) DO UPDATE SET channel_id = excluded.channel_id, user_id = excluded.user_id, "
+                "job_type = excluded.job_type, gen_args = excluded.gen_args, image_refs = excluded.image_refs, "
+                "created = excluded.created, image_digests = excluded.image_digests",
+                (
+                    record.message_id,
+                    record.channel_id,
+                    record.user_id,
+                    record.job_type,
+                    json.dumps(record.gen_args),
+                    json.dumps(record.image_refs),
+                    json.dumps(sorted(record.triggered)),
+                    record.created,
+                    json.dumps(record.image_digests),
+                ),
+            )
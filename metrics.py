@@ -0,0 +1,153 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+import vars
+
+# Upper bounds (seconds) of the cumulative histogram buckets in the text exposition.
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_lock = threading.Lock()
+_local = threading.local()
+_recent: Dict[str, deque] = {}
+_buckets: Dict[str, List[int]] = {}
+_sums: Dict[str, float] = {}
+_counts: Dict[str, int] = {}
+_completed = deque(maxlen=4096)
+
+
+def record(stage: str, seconds: float, timings: Optional[Dict[str, float]] = None) -> None:
+    """Add one observation to the rolling window and histogram of `stage`."""
+    with _lock:
+        window = _recent.get(stage)
+        if window is None:
+            window = _recent[stage] = deque(maxlen=vars.METRICS_WINDOW)
+            _buckets[stage] = [0] * len(BUCKETS)
+            _sums[stage] = 0.0
+            _counts[stage] = 0
+        window.append(seconds)
+        _sums[stage] += seconds
+        _counts[stage] += 1
+        for index, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                _buckets[stage][index] += 1
+    targets = [timings] if timings is not None else []
+    collector = getattr(_local, "timings", None)
+    if collector is not None and collector is not timings:
+        targets.append(collector)
+    for target in targets:
+        target[stage] = target.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def span(stage: str, timings: Optional[Dict[str, float]] = None):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start, timings)
+
+
+@contextmanager
+def collect(timings: Dict[str, float]):
+    """Also add spans recorded on this thread (e.g. inside imagegen) to `timings`."""
+    previous = getattr(_local, "timings", None)
+    _local.timings = timings
+    try:
+        yield timings
+    finally:
+        _local.timings = previous
+
+
+def job_completed(timings: Dict[str, float]) -> None:
+    with _lock:
+        _completed.append(time.time())
+    if vars.METRICS_LOG_JOBS:
+        print("job timings: " + " ".join(f"{stage}={seconds:.3f}" for stage, seconds in timings.items()))
+
+
+def throughput(window: float = 300.0) -> float:
+    """Completed jobs per minute over the last `window` seconds."""
+    cutoff = time.time() - window
+    with _lock:
+        count = sum(1 for finished in _completed if finished >= cutoff)
+    return count * 60.0 / window
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def stage_percentiles(pcts=(50, 95, 99)) -> Dict[str, Dict[str, float]]:
+    with _lock:
+        windows = {stage: list(window) for stage, window in _recent.items()}
+    return {
+        stage: {"count": len(values), **{f"p{p}": percentile(values, p) for p in pcts}}
+        for stage, values in windows.items()
+    }
+
+
+def render_prometheus(gauges: Optional[Dict[str, float]] = None) -> str:
+    """Prometheus text exposition of stage histograms plus any extra gauges."""
+    lines = [
+        "# HELP imagebot_stage_seconds Time spent per job stage.",
+        "# TYPE imagebot_stage_seconds histogram",
+    ]
+    with _lock:
+        for stage in sorted(_counts):
+            for bound, count in zip(BUCKETS, _buckets[stage]):
+                lines.append(f'imagebot_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'imagebot_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {_counts[stage]}')
+            lines.append(f'imagebot_stage_seconds_sum{{stage="{stage}"}} {_sums[stage]:.6f}')
+            lines.append(f'imagebot_stage_seconds_count{{stage="{stage}"}} {_counts[stage]}')
+    for name, value in sorted((gauges or {}).items()):
+        lines.append(f"# TYPE imagebot_{name} gauge")
+        lines.append(f"imagebot_{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+async def run_exporter(gauges: Callable[[], Dict[str, float]]):
+    """Write the exposition to METRICS_FILE and/or serve it on 127.0.0.1:METRICS_PORT."""
+    server = None
+    if vars.METRICS_PORT:
+        async def handle(reader, writer):
+            try:
+                await reader.readuntil(b"\r\n\r\n")
+                body = render_prometheus(gauges()).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                    + f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode()
+                    + body,
+                )
+                await writer.drain()
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                pass
+            finally:
+                writer.close()
+
+        server = await asyncio.start_server(handle, "127.0.0.1", vars.METRICS_PORT)
+
+    try:
+        while True:
+            if vars.METRICS_FILE:
+                text = render_prometheus(gauges())
+                await asyncio.to_thread(_write_atomic, vars.METRICS_FILE, text)
+            await asyncio.sleep(vars.METRICS_INTERVAL)
+    finally:
+        if server is not None:
+            server.close()
+
+
+def _write_atomic(path: str, text: str):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as handle:
+        handle.write(text)
+    os.replace(tmp_path, path)
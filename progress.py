@@ -0,0 +1,108 @@
+import asyncio
+import threading
+import time
+from io import BytesIO
+from typing import Callable, Optional
+
+import discord
+from PIL import Image
+
+import image_io
+import vars
+
+
+def preview_image(preview) -> Optional[Image.Image]:
+    """Pull the PIL image out of a ComfyUI preview (a ("JPEG", image, max_size) tuple or an image)."""
+    if isinstance(preview, Image.Image):
+        return preview
+    if isinstance(preview, tuple) and len(preview) >= 2 and isinstance(preview[1], Image.Image):
+        return preview[1]
+    return None
+
+
+class ProgressReporter:
+    """Mirrors sampler progress into a Discord message.
+
+    `hook` runs on the GPU thread: it only stores the latest (step, total, preview)
+    and, if no wake-up is pending, schedules one on the event loop with
+    call_soon_threadsafe, so the sampler never waits on the loop or on Discord.
+    `run` edits the message only when the step changes, with whatever is newest and no
+    more often than the current interval; nothing is edited before the first report. The interval grows when Discord rate-limits or slows down edits and
+    shrinks back towards PROGRESS_MIN_INTERVAL while edits are fast.
+    """
+
+    def __init__(self, message, loop: asyncio.AbstractEventLoop, total: int, format_progress: Callable[[int, int], str]):
+        self.message = message
+        self._loop = loop
+        self._format = format_progress
+        self._latest = (0, total, None)
+        self._wake_pending = False
+        self._lock = threading.Lock()
+        self._changed = asyncio.Event()
+        self.interval = vars.PROGRESS_MIN_INTERVAL
+        self._last_preview = 0.0
+
+    def hook(self, current, total, preview, node_id=None):
+        with self._lock:
+            self._latest = (current, total, preview)
+            if self._wake_pending:
+                return
+            self._wake_pending = True
+        try:
+            self._loop.call_soon_threadsafe(self._wake)
+        except RuntimeError:
+            # Loop already closed (shutdown); progress no longer matters.
+            pass
+
+    def _wake(self):
+        with self._lock:
+            self._wake_pending = False
+        self._changed.set()
+
+    async def run(self):
+        shown = None
+        while True:
+            await self._changed.wait()
+            self._changed.clear()
+            with self._lock:
+                current, total, preview = self._latest
+
+            if (current, total) == shown:
+                continue
+            shown = (current, total)
+
+            files = None
+            image = preview_image(preview) if vars.PROGRESS_PREVIEW_INTERVAL else None
+            if image is not None and time.monotonic() - self._last_preview >= vars.PROGRESS_PREVIEW_INTERVAL:
+                self._last_preview = time.monotonic()
+                files = [await self._preview_file(image)]
+            await self._edit(content=self._format(current, total), attachments=files)
+            # Let further steps coalesce while the interval runs out.
+            await asyncio.sleep(self.interval)
+
+    async def _preview_file(self, image: Image.Image) -> discord.File:
+        small = image.copy()
+        small.thumbnail((vars.PROGRESS_PREVIEW_SIZE, vars.PROGRESS_PREVIEW_SIZE))
+        data, extension = (await image_io.encode_images([small.convert("RGB")], mode="jpeg"))[0]
+        return discord.File(BytesIO(data), filename=f"preview.{extension}")
+
+    async def _edit(self, content: str, attachments=None):
+        kwargs = {"content": content}
+        if attachments is not None:
+            kwargs["attachments"] = attachments
+        started = time.monotonic()
+        try:
+            await self.message.edit(**kwargs)
+        except discord.RateLimited as e:
+            self.interval = min(vars.PROGRESS_MAX_INTERVAL, max(self.interval * 2, e.retry_after))
+            return
+        except discord.HTTPException as e:
+            if e.status == 429:
+                self.interval = min(vars.PROGRESS_MAX_INTERVAL, self.interval * 2)
+            return
+        latency = time.monotonic() - started
+        # discord.py waits out rate-limit buckets inside edit(), so slow edits mean we are near the limit.
+        if latency > self.interval / 2:
+            self.interval = min(vars.PROGRESS_MAX_INTERVAL, max(self.interval * 1.5, latency * 2))
+        else:
+            self.interval = max(vars.PROGRESS_MIN_INTERVAL, self.interval * 0.9)
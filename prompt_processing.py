@@ -1,7 +1,11 @@
+from __future__ import annotations
+
 import random
 import re
+from functools import lru_cache
 from typing import Dict, Iterable, List, Sequence, Tuple
 
+import vars
 from vars import (
     DEFAULT_POSITIVE_PROMPT,
     DEFAULT_NEGATIVE_PROMPT,
@@ -13,7 +17,7 @@ from vars import (
 
 KEY_TOKEN = re.compile(r"\{([^{}]+)\}")
 NUMBER_TOKEN = re.compile(r"-?\d+(?:\.\d+)?")
-SUMMARY_SKIP = {"prompt", "neg_prompt", "display_prompt", "display_neg_prompt"}
+SUMMARY_SKIP = {"prompt", "neg_prompt", "display_prompt", "display_neg_prompt", "tiled", "latent"}
 
 SAMPLING_FIELDS: Sequence[Tuple[Sequence[str], str, callable | None]] = (
     (("cfg",), "cfg", None),
@@ -38,35 +42,203 @@ def _clean(text: str) -> str:
     return (text or "").strip(" ,")
 
 
-def _replace_keywords(text: str, cache: Dict[str, str] | None = None) -> str:
-    if not text:
-        return ""
-
-    cache = {} if cache is None else cache
-
-    def substitute(match) -> str:
+@lru_cache(maxsize=2048)
+def _parse(text: str) -> Tuple[object, ...]:
+    """Split text into literal strings and (key, raw token) pairs for each {token}."""
+    segments: List[object] = []
+    position = 0
+    for match in KEY_TOKEN.finditer(text):
         key = match.group(1).strip()
         if not key:
-            return match.group(0)
-        if key in cache:
-            return cache[key]
-
-        if key in KEYWORDS:
-            cache[key] = _replace_keywords(KEYWORDS[key], cache)
-        elif key in WILDCARDS:
-            options = [option for option in WILDCARDS[key] if _clean(option)]
-            selection = random.choice(options) if options else ""
-            cache[key] = _replace_keywords(selection, cache)
+            continue
+        if match.start() > position:
+            segments.append(text[position:match.start()])
+        segments.append((key, match.group(0)))
+        position = match.end()
+    if position < len(text):
+        segments.append(text[position:])
+    return tuple(segments)
+
+
+class PromptExpander:
+    """KEYWORDS/WILDCARDS compiled once per config load.
+
+    Every keyword value and wildcard option is parsed up front into a dependency
+    graph. Keywords that do not (transitively) reach a wildcard are expanded once at
+    compile time, as is the default negative prompt when it is static; only wildcard
+    choices are resolved per request, memoised in the request's token cache so a
+    wildcard picks the same option everywhere in one request. Keys that reference
+    themselves (directly or through others) are reported and left as literal text.
+    """
+
+    def __init__(self, keywords: Dict[str, str], wildcards: Dict[str, Sequence[str]], default_negative: str = ""):
+        self._templates = {key: _parse(value or "") for key, value in keywords.items()}
+        self._options = {
+            key: [_parse(option) for option in options if _clean(option)]
+            for key, options in wildcards.items() if key not in self._templates
+        }
+        self._static: Dict[str, str] = {}
+        self.cyclic = self._find_cycles()
+        if self.cyclic:
+            print(f"Prompt keywords/wildcards reference themselves and stay unexpanded: {', '.join(sorted(self.cyclic))}")
+        for key in self._topological_order():
+            if key in self._templates and key not in self.cyclic:
+                value = self._render_static(self._templates[key])
+                if value is not None:
+                    self._static[key] = value
+        static_negative = self._render_static(_parse(default_negative)) if default_negative else ""
+        self.default_negative = _clean(static_negative) if static_negative is not None else None
+
+    def _dependencies(self, key: str):
+        segment_lists = [self._templates[key]] if key in self._templates else self._options.get(key, [])
+        for segments in segment_lists:
+            for segment in segments:
+                if isinstance(segment, tuple) and (segment[0] in self._templates or segment[0] in self._options):
+                    yield segment[0]
+
+    def _topological_order(self) -> List[str]:
+        """Known keys, dependencies before dependents (iterative, so deep nesting is fine)."""
+        order: List[str] = []
+        visited: set[str] = set()
+        for root in list(self._templates) + list(self._options):
+            if root in visited:
+                continue
+            visited.add(root)
+            stack = [(root, iter(self._dependencies(root)))]
+            while stack:
+                key, children = stack[-1]
+                for child in children:
+                    if child not in visited:
+                        visited.add(child)
+                        stack.append((child, iter(self._dependencies(child))))
+                        break
+                else:
+                    stack.pop()
+                    order.append(key)
+        return order
+
+    def _find_cycles(self) -> set:
+        """Keys on a reference cycle (Tarjan's strongly connected components)."""
+        index: Dict[str, int] = {}
+        lowlink: Dict[str, int] = {}
+        on_stack: set[str] = set()
+        component_stack: List[str] = []
+        cyclic: set[str] = set()
+        counter = 0
+        for root in list(self._templates) + list(self._options):
+            if root in index:
+                continue
+            work = [(root, iter(self._dependencies(root)))]
+            index[root] = lowlink[root] = counter
+            counter += 1
+            component_stack.append(root)
+            on_stack.add(root)
+            while work:
+                key, children = work[-1]
+                advanced = False
+                for child in children:
+                    if child not in index:
+                        index[child] = lowlink[child] = counter
+                        counter += 1
+                        component_stack.append(child)
+                        on_stack.add(child)
+                        work.append((child, iter(self._dependencies(child))))
+                        advanced = True
+                        break
+                    if child in on_stack:
+                        lowlink[key] = min(lowlink[key], index[child])
+                if advanced:
+                    continue
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[key])
+                if lowlink[key] == index[key]:
+                    component = []
+                    while True:
+                        member = component_stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == key:
+                            break
+                    if len(component) > 1 or key in self._dependencies(key):
+                        cyclic.update(component)
+        return cyclic
+
+    def _render_static(self, segments) -> str | None:
+        """Expansion of `segments` if it involves no wildcard, else None."""
+        parts = []
+        for segment in segments:
+            if isinstance(segment, str):
+                parts.append(segment)
+                continue
+            key, raw = segment
+            if key in self._static:
+                parts.append(self._static[key])
+            elif key in self.cyclic or (key not in self._templates and key not in self._options):
+                parts.append(raw)
+            else:
+                return None
+        return "".join(parts)
+
+    def _resolve(self, key: str, raw: str, cache: Dict[str, str]) -> str:
+        value = self._static.get(key)
+        if value is not None:
+            return value
+        value = cache.get(key)
+        if value is not None:
+            return value
+        if key in self.cyclic:
+            value = raw
+        elif key in self._templates:
+            value = self._render(self._templates[key], cache)
+        elif key in self._options:
+            options = self._options[key]
+            value = self._render(random.choice(options), cache) if options else ""
         else:
-            cache[key] = match.group(0)
-        return cache[key]
+            value = raw
+        cache[key] = value
+        return value
+
+    def _render(self, segments, cache: Dict[str, str]) -> str:
+        return "".join(
+            segment if isinstance(segment, str) else self._resolve(segment[0], segment[1], cache)
+            for segment in segments
+        )
+
+    def expand(self, text: str, cache: Dict[str, str] | None = None) -> str:
+        """Replace {keyword}/{wildcard} tokens in user text; unknown tokens are kept as written."""
+        if not text:
+            return ""
+        cache = {} if cache is None else cache
+        current = text
+        while True:
+            segments = _parse(current)
+            result = self._render(segments, cache)
+            # Expansions are already complete, so another pass is only needed when braces
+            # around a token (e.g. "{{name}}") turned into a new token.
+            if result == current or "{" not in result:
+                return result
+            current = result
+
+
+_expander = PromptExpander(KEYWORDS, WILDCARDS, DEFAULT_NEGATIVE_PROMPT)
+
+
+def reload_config() -> None:
+    """Re-read prompt settings from the (reloaded) vars module and recompile the expander."""
+    global DEFAULT_POSITIVE_PROMPT, DEFAULT_NEGATIVE_PROMPT, KEYWORDS, LORA_CONFIG, WILDCARDS, _expander  # noqa: PLW0603
+    DEFAULT_POSITIVE_PROMPT = vars.DEFAULT_POSITIVE_PROMPT
+    DEFAULT_NEGATIVE_PROMPT = vars.DEFAULT_NEGATIVE_PROMPT
+    KEYWORDS = vars.KEYWORDS
+    LORA_CONFIG = vars.LORA_CONFIG
+    WILDCARDS = vars.WILDCARDS
+    _expander = PromptExpander(KEYWORDS, WILDCARDS, DEFAULT_NEGATIVE_PROMPT)
+    _parse.cache_clear()
 
-    previous = None
-    current = text
-    while current != previous:
-        previous = current
-        current = KEY_TOKEN.sub(substitute, current)
-    return current
+
+def _replace_keywords(text: str, cache: Dict[str, str] | None = None) -> str:
+    return _expander.expand(text, cache)
 
 
 def _normalize_list(value) -> List[str]:
@@ -113,7 +285,9 @@ def preprocess_prompt(prompt: str, neg_prompt: str | None, lora_names: Iterable[
 
     user_negative_raw = _clean(neg_prompt or "")
     user_negative = _clean(_replace_keywords(user_negative_raw, token_cache))
-    default_negative = _clean(_replace_keywords(DEFAULT_NEGATIVE_PROMPT, token_cache)) if DEFAULT_NEGATIVE_PROMPT else ""
+    default_negative = _expander.default_negative
+    if default_negative is None:
+        default_negative = _clean(_replace_keywords(DEFAULT_NEGATIVE_PROMPT, token_cache))
 
     if user_negative and user_negative != default_negative:
         negative = f"{user_negative}, {default_negative}" if default_negative else user_negative
@@ -128,6 +302,27 @@ def preprocess_prompt(prompt: str, neg_prompt: str | None, lora_names: Iterable[
     return result
 
 
+def preprocess_gen_args(gen_args, default_args):
+    assert 'prompt' in gen_args and 'neg_prompt' in gen_args
+
+    for key, value in default_args.items():
+        gen_args.setdefault(key, value)
+
+    if 'seed' not in gen_args or gen_args['seed'] is None:
+        gen_args['seed'] = random.randint(0, 2**32 - 1)
+
+    if 'lora' in gen_args:
+        value = gen_args['lora']
+        names = [value] if isinstance(value, str) else list(value)
+        filtered = tuple(name for name in names if name)
+        if filtered:
+            gen_args['lora'] = filtered
+        else:
+            gen_args.pop('lora')
+
+    return gen_args
+
+
 def _format_number(value: float) -> str:
     return str(int(value)) if float(value).is_integer() else f"{float(value):g}"
 
@@ -249,4 +444,4 @@ def format_generation_summary(gen_args: Dict, default_model: str) -> str:
     if not segments:
         segments.append(_format_field("model", default_model))
 
-    return "> " + " | ".join(segments)
\ No newline at end of file
+    return "> " + " | ".join(segments)
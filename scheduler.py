@@ -0,0 +1,142 @@
+import asyncio
+import itertools
+from collections import deque
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+
+class JobScheduler:
+    """Fair job queue: per-user start-time fair queuing with priority classes.
+
+    Each job gets a virtual start tag when queued (its user's previous finish tag, or
+    the current virtual time if the user was idle) and advances the user's finish tag
+    by its estimated cost. Jobs are served lowest priority class first, then lowest
+    start tag, so a user with a dozen expensive jobs queued interleaves with everyone
+    else instead of blocking them. Users at `user_cap` jobs in flight are skipped
+    while anyone else has work waiting. Jobs for which `ready_of` is false (e.g. still
+    waiting on prompt enhancement) keep their place but are passed over until ready.
+
+    Exposes the subset of asyncio.Queue used by the bot (put/get/task_done/join/qsize).
+    """
+
+    def __init__(
+        self,
+        user_of: Callable[[object], Hashable],
+        cost_of: Callable[[object], float],
+        priority_of: Callable[[object], int],
+        user_cap: int = 2,
+        ready_of: Optional[Callable[[object], bool]] = None,
+    ):
+        self._user_of = user_of
+        self._ready_of = ready_of or (lambda job: True)
+        self._cost_of = cost_of
+        self._priority_of = priority_of
+        self.user_cap = user_cap
+        self._queues: Dict[Tuple[Hashable, int], deque] = {}
+        self._finish_tags: Dict[Hashable, float] = {}
+        self._in_flight: Dict[Hashable, int] = {}
+        self._virtual_time = 0.0
+        self._seq = itertools.count()
+        self._queued = 0
+        self._unfinished = 0
+        self._changed = asyncio.Condition()
+        self._all_done = asyncio.Event()
+        self._all_done.set()
+
+    def qsize(self) -> int:
+        return self._queued
+
+    def _tags(self, job) -> Tuple[int, float, float]:
+        user = self._user_of(job)
+        start = max(self._virtual_time, self._finish_tags.get(user, 0.0))
+        return self._priority_of(job), start, start + max(self._cost_of(job), 1e-6)
+
+    async def put(self, job) -> None:
+        priority, start, finish = self._tags(job)
+        user = self._user_of(job)
+        self._finish_tags[user] = finish
+        self._queues.setdefault((user, priority), deque()).append(((priority, start, next(self._seq)), job))
+        self._queued += 1
+        self._unfinished += 1
+        self._all_done.clear()
+        async with self._changed:
+            self._changed.notify_all()
+
+    def _heads(self, under_cap_only: bool):
+        """First ready job of each (user, priority) queue: (order, user, queue, index)."""
+        for (user, _), queue in self._queues.items():
+            if under_cap_only and self._in_flight.get(user, 0) >= self.user_cap:
+                continue
+            for index, (order, job) in enumerate(queue):
+                if self._ready_of(job):
+                    yield order, user, queue, index
+                    break
+
+    def _pop(self, predicate: Optional[Callable[[object], bool]] = None):
+        # The cap only holds back a user while someone under the cap has ready work, so the GPU
+        # never idles. That is decided before `predicate` filters, so a merge cannot pull a capped
+        # user's matching jobs ahead of another user's job with a different batch key.
+        candidates = sorted(self._heads(True), key=lambda head: head[0])
+        if not candidates:
+            candidates = sorted(self._heads(False), key=lambda head: head[0])
+        if predicate is not None:
+            candidates = [head for head in candidates if predicate(head[2][head[3]][1])]
+        if not candidates:
+            return None
+        order, user, queue, index = candidates[0]
+        _, job = queue[index]
+        del queue[index]
+        if not queue:
+            del self._queues[(user, order[0])]
+        self._queued -= 1
+        self._in_flight[user] = self._in_flight.get(user, 0) + 1
+        self._virtual_time = max(self._virtual_time, order[1])
+        return job
+
+    async def get(self):
+        async with self._changed:
+            while True:
+                job = self._pop()
+                if job is not None:
+                    return job
+                await self._changed.wait()
+
+    def take_matching(self, predicate: Callable[[object], bool]):
+        """Pop the next ready job (in service order) that satisfies `predicate`, if any."""
+        return self._pop(predicate)
+
+    async def wait_for_change(self, timeout: float) -> bool:
+        """Wait until a job is queued or finished; False on timeout."""
+        try:
+            async with self._changed:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def ready_changed(self) -> None:
+        """Wake waiting consumers after a queued job became ready."""
+        asyncio.get_running_loop().create_task(self._notify())
+
+    def task_done(self, job) -> None:
+        user = self._user_of(job)
+        self._in_flight[user] = max(0, self._in_flight.get(user, 0) - 1)
+        self._unfinished -= 1
+        if self._unfinished <= 0:
+            self._unfinished = 0
+            self._all_done.set()
+        asyncio.get_running_loop().create_task(self._notify())
+
+    async def _notify(self):
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def join(self) -> None:
+        await self._all_done.wait()
+
+    def jobs_ahead_if_queued(self, job) -> List[object]:
+        """Queued jobs that would be served before `job` if it were put now."""
+        priority, start, _ = self._tags(job)
+        return [
+            queued for queue in self._queues.values() for order, queued in queue
+            if (order[0], order[1]) <= (priority, start)
+        ]
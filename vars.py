@@ -6,18 +6,16 @@ MODEL_NAME = "z_image"
 # "oneObsession_v18"
 MODEL_PATH = f"/home/xr/code/ComfyUI/models/checkpoints/{MODEL_NAME}.safetensors"
 
-import yaml
-with open('api_keys.yaml', 'r') as file:
-    data = yaml.safe_load(file)
-
-DISCORD_TOKEN = data['DISCORD_TOKEN']
-OPENROUTER_API_KEY = data['OPENROUTER_API_KEY']
-CHANNEL_IDS = [data['CHANNEL_ID']]
+# Secrets are read from api_keys.yaml on first access (see __getattr__ at the bottom), so
+# engine workers and tools can import vars without the file.
+API_KEYS_PATH = 'api_keys.yaml'
+_api_keys = None
 REROLL_EMOJI = "🌺"
 DELETE_EMOJI = "🗑️"
 UPSCALE_WEAK_EMOJI = "🔎"
 UPSCALE_HARD_EMOJI = "🎨"
 NUMBER_EMOJIS = ["1️⃣", "2️⃣", "3️⃣", "4️⃣"]
+UPSCALE_ALL_EMOJI = "⏫"
 
 SAMPLERS = ["euler", "euler_ancestral", "dpmpp_2m", "dpmpp_sde"]
 SCHEDULERS = ["normal", "simple", "beta", "sgm_uniform"]
@@ -54,6 +52,8 @@ upscale_weak_args = {
     'cfg': 7,
     'sampler_name': "euler",
     'scheduler': "normal",
+    'tiled': False,
+    'latent': False,
 }
 
 upscale_hard_args = {
@@ -63,6 +63,8 @@ upscale_hard_args = {
     'cfg': 7,
     'sampler_name': "euler",
     'scheduler': "normal",
+    'tiled': False,
+    'latent': False,
 }
 
 KEYWORDS = {
@@ -222,6 +224,104 @@ DIMENSION_PRESETS = {
     "1536x1280": (1536, 1280),
 }
 
+# Tiled upscaling (presets with 'tiled': True or /upscale tiled:true): tile edge and overlap in
+# pixels of the upscaled image (largest tile edge, minimum overlap), and how many tiles share one
+# sampler call. Edges within one tile plus the overlap are sampled whole.
+UPSCALE_TILE_SIZE = 1024
+UPSCALE_TILE_OVERLAP = 128
+UPSCALE_TILE_BATCH = 2
+
+# Patched (model, clip) pairs kept per LoRA stack; budget is estimated from LoRA file sizes.
+LORA_CACHE_MAX_ENTRIES = 8
+LORA_CACHE_BUDGET_MB = 2048
+# Encoded prompts reused across jobs (keyed by text encoder, LoRA stack and prompt text).
+CONDITIONING_CACHE_MAX_ENTRIES = 128
+CONDITIONING_CACHE_BUDGET_MB = 512
+# Compatible queued txt2img jobs are merged into one sampler pass up to this latent batch.
+MICROBATCH_MAX_BATCH = 4
+MICROBATCH_WINDOW = 0.2  # seconds to wait for more compatible jobs; 0 disables merging
+
+# Output encoding: "png", "webp_lossless", or lossy "webp"/"jpeg" (smaller, faster uploads).
+OUTPUT_FORMAT = "png"
+PNG_COMPRESS_LEVEL = 6  # 0-9, lower is faster and larger
+OUTPUT_QUALITY = 92  # webp/jpeg quality
+# Encode/decode runs in a dedicated pool so it never blocks the event loop.
+IMAGE_IO_WORKERS = 2
+IMAGE_IO_MAX_PENDING = 8
+IMAGE_IO_USE_PROCESSES = False
+# Prepared batches waiting for the GPU, and finished batches being encoded/posted concurrently.
+PIPELINE_DEPTH = 1
+PIPELINE_MAX_PUBLISHING = 4
+# Jobs per user taken from the queue at once while other users are waiting.
+USER_MAX_IN_FLIGHT = 2
+
+# ETA model learned from completed jobs, and admission control on predicted wait.
+COST_MODEL_PATH = "cost_model.json"
+MAX_PREDICTED_WAIT = None  # seconds until a new job would finish; None disables admission control
+ADMISSION_MODE = "downscale"  # "downscale": drop batch to 1 before rejecting; "reject": reject outright
+
+# Per-stage timings: rolling window size for /stats percentiles, optional Prometheus text output.
+METRICS_WINDOW = 500
+METRICS_FILE = None  # e.g. "metrics.prom"
+METRICS_PORT = None  # e.g. 9464, served on 127.0.0.1 only
+METRICS_INTERVAL = 15.0
+METRICS_LOG_JOBS = False
+
+# SQLite journal of queued jobs, replayed on startup; None keeps the queue in memory only.
+JOURNAL_PATH = "bot_state.sqlite3"
+JOURNAL_MAX_ATTEMPTS = 3  # drop a job that was in flight during this many crashes
+# Output message -> exact generation arguments, so reactions resolve without re-parsing messages.
+MESSAGE_INDEX_PATH = "bot_state.sqlite3"
+MESSAGE_INDEX_CACHE_SIZE = 2000
+MESSAGE_INDEX_MAX_AGE_DAYS = 90
+# Local copies of generated images, so upscales never re-download the bot's own uploads.
+IMAGE_STORE_DIR = "image_store"
+IMAGE_STORE_BUDGET_MB = 4096
+IMAGE_STORE_HOT_ENTRIES = 32  # decoded images kept in memory
+# Sampled latents of recent generations, for presets with 'latent': True, which upscale
+# in latent space instead of resizing pixels and re-encoding them with the VAE.
+LATENT_CACHE_MAX_ENTRIES = 256
+LATENT_CACHE_BUDGET_MB = 512
+LATENT_UPSCALE_METHOD = "bislerp"  # nearest-exact, bilinear, area, bicubic or bislerp
+UPSCALE_BATCH = 4  # images of one "upscale all" request refined per sampler pass
+# Progress message edits: the interval adapts between these bounds (seconds) to Discord's
+# rate limits. Set PROGRESS_PREVIEW_INTERVAL to attach a small latent preview at most that often
+# (needs ComfyUI's latent previews enabled).
+PROGRESS_MIN_INTERVAL = 1.0
+PROGRESS_MAX_INTERVAL = 10.0
+PROGRESS_PREVIEW_INTERVAL = None
+PROGRESS_PREVIEW_SIZE = 256
+# Prompt enhancement (chat-completions API, OpenRouter by default). Completions are cached
+# per (model, template, prompt) in memory and in LLM_CACHE_PATH.
+LLM_API_URL = "https://openrouter.ai/api/v1/chat/completions"
+LLM_MODEL = "qwen/qwen3-8b"
+LLM_MAX_CONCURRENCY = 4
+LLM_MAX_RETRIES = 3  # on 429/5xx and connection errors, with exponential backoff
+LLM_TIMEOUT = 30.0
+LLM_CACHE_SIZE = 512
+LLM_CACHE_PATH = "bot_state.sqlite3"
+LLM_ENHANCE_TIMEOUT = 30.0  # queued jobs run with the original prompt if enhancement takes longer
+# Worker processes: one engine subprocess per entry, pinned via CUDA_VISIBLE_DEVICES (e.g. ["0", "1"]).
+# Empty runs generation inside the bot process. WORKER_PRELOAD ("module:function") runs in each
+# worker before imagegen is imported (benchmarks use "fake_comfy:install" for CPU-only stubs).
+WORKER_DEVICES = []
+WORKER_PRELOAD = None
+WORKER_HEALTH_INTERVAL = 15.0
+WORKER_PING_TIMEOUT = 10.0
+WORKER_MAX_ATTEMPTS = 2  # tries per job when its worker dies mid-request
+# Startup warm-up, GPU only (a no-op on CPU-only machines): WARMUP_SAMPLES runs a WARMUP_STEPS-step
+# txt2img, weak and hard upscale per dimension preset (WARMUP_DIMENSIONS names, default all) so
+# kernel selection and allocator growth happen before the first user job. TORCH_COMPILE wraps the
+# diffusion model in torch.compile; compiling happens during warm-up (or the first job).
+WARMUP_SAMPLES = False
+WARMUP_STEPS = 1
+WARMUP_DIMENSIONS = None
+TORCH_COMPILE = False
+TORCH_COMPILE_MODE = "default"
+# Engine servers started separately with `python engine.py --socket PATH`; jobs are shared
+# with any WORKER_DEVICES workers. The bot reconnects when an engine is restarted.
+ENGINE_SOCKETS = []
+
 if MODEL_NAME == "z_image":
     txt2img_args = {
         'width': 1120,
@@ -239,6 +339,8 @@ if MODEL_NAME == "z_image":
         'cfg': 1,
         'sampler_name': "euler",
         'scheduler': "simple",
+        'tiled': False,
+        'latent': False,
     }
 
     upscale_hard_args = {
@@ -248,7 +350,22 @@ if MODEL_NAME == "z_image":
         'cfg': 1,
         'sampler_name': "euler",
         'scheduler': "simple",
+        'tiled': False,
+        'latent': False,
     }
 
     LORA_CONFIG = LORA_CONFIG_Z_IMAGE
     DEFAULT_POSITIVE_PROMPT = DEFAULT_NEGATIVE_PROMPT = ""
+
+
+def __getattr__(name):
+    global _api_keys
+    if name not in ('DISCORD_TOKEN', 'OPENROUTER_API_KEY', 'CHANNEL_IDS'):
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if _api_keys is None:
+        import yaml
+        with open(API_KEYS_PATH, 'r') as file:
+            _api_keys = yaml.safe_load(file)
+    if name == 'CHANNEL_IDS':
+        return [_api_keys['CHANNEL_ID']]
+    return _api_keys[name]
@@ -0,0 +1,264 @@
+import asyncio
+import os
+import sys
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, List, Optional, Sequence
+
+import engine
+
+ENGINE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "engine.py")
+
+
+class WorkerDied(Exception):
+    pass
+
+
+class Worker:
+    """One engine subprocess (`engine.py --stdio`) pinned to one device."""
+
+    def __init__(self, name: str, device: Optional[str] = None, preload: Optional[str] = None):
+        self.name = name
+        self.device = device
+        self.preload = preload
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer = None
+        self.busy = False
+        self.last_used = 0.0
+        self.jobs = 0
+        self.restarts = 0
+        # Affinity keys (LoRA stacks) this worker has recently run, most recent last.
+        self.loaded: "OrderedDict[Hashable, None]" = OrderedDict()
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    async def start(self) -> None:
+        env = dict(os.environ)
+        if self.device is not None:
+            env["CUDA_VISIBLE_DEVICES"] = str(self.device)
+        env["PYTHONPATH"] = os.pathsep.join([p for p in sys.path if p] + [env.get("PYTHONPATH", "")])
+        args = [sys.executable, ENGINE_SCRIPT, "--stdio"]
+        if self.preload:
+            args += ["--preload", self.preload]
+        self.process = await asyncio.create_subprocess_exec(
+            *args, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, env=env, limit=1 << 20,
+        )
+        self.reader, self.writer = self.process.stdout, self.process.stdin
+        self.loaded.clear()
+
+    async def stop(self) -> None:
+        if self.alive:
+            self.process.kill()
+            await self.process.wait()
+
+    def describe_exit(self) -> str:
+        return f"exited with code {self.process.returncode if self.process else None}"
+
+    async def request(self, header: dict, blobs: Sequence[bytes] = (), progress=None) -> engine.Frame:
+        if self.writer is None:
+            raise WorkerDied(f"{self.name} is not connected")
+        try:
+            for part in engine.encode_frame(header, blobs):
+                self.writer.write(part)
+            await self.writer.drain()
+            while True:
+                response, out_blobs = await engine.read_frame_async(self.reader)
+                if response.get("op") == "progress":
+                    if progress is not None:
+                        progress(response["current"], response["total"])
+                    continue
+                return response, out_blobs
+        except (asyncio.IncompleteReadError, ConnectionError, BrokenPipeError) as exc:
+            raise WorkerDied(f"{self.name} exited ({exc!r})") from exc
+
+
+class RemoteEngine(Worker):
+    """A connection to an engine server (`engine.py --socket PATH`) started separately.
+
+    The pool cannot restart the server process; "restarting" reconnects, so the
+    engine can be restarted or warmed on its own and the bot picks it up again.
+    """
+
+    def __init__(self, name: str, path: str):
+        super().__init__(name)
+        self.path = path
+
+    @property
+    def alive(self) -> bool:
+        return self.writer is not None and not self.writer.is_closing() and not self.reader.at_eof()
+
+    async def start(self) -> None:
+        try:
+            self.reader, self.writer = await asyncio.open_unix_connection(self.path, limit=1 << 20)
+        except OSError as exc:
+            self.reader = self.writer = None
+            print(f"Engine {self.path} unavailable: {exc}")
+        self.loaded.clear()
+
+    async def stop(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+    def describe_exit(self) -> str:
+        return "disconnected"
+
+
+def spawn_workers(devices: Sequence[Optional[str]], preload: Optional[str] = None) -> List[Worker]:
+    return [Worker(f"worker-{index}", device, preload) for index, device in enumerate(devices)]
+
+
+def connect_engines(paths: Sequence[str]) -> List[Worker]:
+    return [RemoteEngine(f"engine-{index}", path) for index, path in enumerate(paths)]
+
+
+class WorkerPool:
+    """Dispatches engine requests across engine workers, one request per worker at a time.
+
+    Requests with an affinity key (the LoRA stack) prefer an idle worker that ran the
+    same key recently, so its patched model and text-encoder caches are reused;
+    otherwise the least recently used idle worker is taken. A background task pings
+    idle workers and restarts any that died or stopped answering, and a request
+    whose worker dies mid-flight is retried on another worker.
+    """
+
+    def __init__(
+        self,
+        workers: Sequence[Worker],
+        health_interval: float = 15.0,
+        ping_timeout: float = 10.0,
+        max_attempts: int = 2,
+        affinity_slots: int = 8,
+    ):
+        self.workers = list(workers)
+        self.health_interval = health_interval
+        self.ping_timeout = ping_timeout
+        self.max_attempts = max_attempts
+        self.affinity_slots = affinity_slots
+        self._idle = asyncio.Condition()
+        self._health_task: Optional[asyncio.Task] = None
+        self.affinity_hits = 0
+
+    @property
+    def size(self) -> int:
+        return len(self.workers)
+
+    async def start(self) -> None:
+        await asyncio.gather(*(worker.start() for worker in self.workers))
+        self._health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+        await asyncio.gather(*(worker.stop() for worker in self.workers))
+
+    def _choose(self, affinity: Optional[Hashable]) -> Optional[Worker]:
+        idle = [worker for worker in self.workers if not worker.busy and worker.alive]
+        if not idle:
+            return None
+        if affinity is not None:
+            warm = [worker for worker in idle if affinity in worker.loaded]
+            if warm:
+                self.affinity_hits += 1
+                return min(warm, key=lambda worker: worker.last_used)
+        return min(idle, key=lambda worker: worker.last_used)
+
+    async def _acquire(self, affinity: Optional[Hashable]) -> Worker:
+        async with self._idle:
+            while True:
+                worker = self._choose(affinity)
+                if worker is not None:
+                    worker.busy = True
+                    return worker
+                await self._idle.wait()
+
+    async def _release(self, worker: Worker) -> None:
+        worker.busy = False
+        worker.last_used = time.monotonic()
+        async with self._idle:
+            self._idle.notify_all()
+
+    async def _restart(self, worker: Worker, reason: str) -> None:
+        print(f"Restarting {worker.name}: {reason}")
+        worker.restarts += 1
+        await worker.stop()
+        await worker.start()
+        async with self._idle:
+            self._idle.notify_all()
+
+    async def submit(
+        self,
+        header: dict,
+        blobs: Sequence[bytes] = (),
+        affinity: Optional[Hashable] = None,
+        progress: Optional[Callable[[int, int], None]] = None,
+    ) -> engine.Frame:
+        """Run a request on some worker; retries on another worker if it dies mid-request."""
+        for attempt in range(1, self.max_attempts + 1):
+            worker = await self._acquire(affinity)
+            try:
+                response, out_blobs = await worker.request(header, blobs, progress)
+            except WorkerDied as exc:
+                await self._restart(worker, str(exc))
+                await self._release(worker)
+                if attempt == self.max_attempts:
+                    raise
+                continue
+            worker.jobs += 1
+            if affinity is not None:
+                worker.loaded[affinity] = None
+                worker.loaded.move_to_end(affinity)
+                while len(worker.loaded) > self.affinity_slots:
+                    worker.loaded.popitem(last=False)
+            await self._release(worker)
+            if not response.get("ok"):
+                raise RuntimeError(f"{worker.name}: {response.get('error')}")
+            return response, out_blobs
+        raise RuntimeError("unreachable")
+
+    async def broadcast(self, header: dict) -> List[dict]:
+        """Send a control request (e.g. reload, warm) to every worker once it is idle, all in parallel."""
+
+        async def send(worker: Worker) -> dict:
+            async with self._idle:
+                while worker.busy:
+                    await self._idle.wait()
+                worker.busy = True
+            try:
+                return (await worker.request(header))[0]
+            except WorkerDied as exc:
+                await self._restart(worker, str(exc))
+                return {"ok": False, "error": str(exc)}
+            finally:
+                await self._release(worker)
+
+        return list(await asyncio.gather(*(send(worker) for worker in self.workers)))
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_interval)
+            for worker in self.workers:
+                if worker.busy:
+                    continue
+                if not worker.alive:
+                    await self._restart(worker, worker.describe_exit())
+                    continue
+                worker.busy = True
+                try:
+                    await asyncio.wait_for(worker.request({"op": "ping"}), self.ping_timeout)
+                except (asyncio.TimeoutError, WorkerDied) as exc:
+                    await self._restart(worker, f"health check failed ({exc!r})")
+                finally:
+                    await self._release(worker)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.size,
+            "alive": sum(worker.alive for worker in self.workers),
+            "busy": sum(worker.busy for worker in self.workers),
+            "restarts": sum(worker.restarts for worker in self.workers),
+            "affinity_hits": self.affinity_hits,
+        }